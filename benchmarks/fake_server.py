@@ -0,0 +1,161 @@
+import json
+import re
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+ISSUE_KEY_PATTERN = r"[A-Z][A-Z0-9]*-\d+"
+CONFLUENCE_PATH = "/confluence/rest/api/content"
+
+
+def issue_type(key):
+    # deterministic, so every run sees the same bugs
+    return "Bug" if int(key.rsplit("-", 1)[1]) % 3 == 0 else "Story"
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    # answers the JIRA search and Confluence content calls code_metrics makes
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length).decode("utf-8"))
+
+    def _count(self):
+        # counts the request, and answers it with an error if the server
+        # was told to fail the next ones
+        with self.server.lock:
+            self.server.requests += 1
+            failing = self.server.fail_next > 0
+            if failing:
+                self.server.fail_next -= 1
+        if failing:
+            self._send({"message": "service unavailable"}, 503)
+        return failing
+
+    def do_GET(self):
+        if self._count():
+            return None
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.endswith("/serverInfo"):
+            return self._send({
+                "baseUrl": "http://localhost", "version": "8.0.0",
+                "versionNumbers": [8, 0, 0], "deploymentType": "Server",
+            })
+        if url.path.endswith("/search") and "jql" in query:
+            return self._jira_search(query)
+        if url.path.startswith(CONFLUENCE_PATH):
+            return self._confluence_get(url.path, query)
+        return self._send({})
+
+    def do_POST(self):
+        data = self._read_json()
+        if self._count():
+            return None
+        pages = self.server.pages
+        with self.server.lock:
+            page_id = str(len(pages) + 1)
+            pages[page_id] = {
+                "id": page_id, "title": data["title"], "version": 1,
+                "body": data.get("body", {}).get("storage", {}).get("value", ""),
+            }
+        self._send(self._page(pages[page_id]))
+
+    def do_PUT(self):
+        data = self._read_json()
+        if self._count():
+            return None
+        page = self.server.pages[self.path.rstrip("/").rsplit("/", 1)[1]]
+        with self.server.lock:
+            if data["version"]["number"] != page["version"] + 1:
+                return self._send({"message": "version conflict"}, 409)
+            page["version"] += 1
+            page["body"] = data["body"]["storage"]["value"]
+        self._send(self._page(page))
+
+    def _jira_search(self, query):
+        keys = sorted(set(re.findall(ISSUE_KEY_PATTERN, query["jql"][0])))
+        start = int(query.get("startAt", ["0"])[0])
+        count = min(int(query.get("maxResults", ["50"])[0]), 50)
+        issues = [
+            {"id": key, "key": key, "self": self.path,
+             "fields": {"issuetype": {"name": issue_type(key)}}}
+            for key in keys[start:start + count]
+        ]
+        self._send({
+            "startAt": start, "maxResults": count, "total": len(keys),
+            "issues": issues,
+        })
+
+    def _page(self, page):
+        return {
+            "id": page["id"], "title": page["title"],
+            "version": {"number": page["version"]},
+            "body": {"storage": {"value": page["body"]}},
+        }
+
+    def _confluence_get(self, path, query):
+        pages = list(self.server.pages.values())
+        if path.endswith("/search"):
+            titles = re.findall(r'"((?:[^"\\]|\\.)*)"', query["cql"][0])[1:]
+            found = [page for page in pages if page["title"] in titles]
+        elif path.rstrip("/") != CONFLUENCE_PATH:
+            return self._send(self._page(
+                self.server.pages[path.rstrip("/").rsplit("/", 1)[1]]))
+        else:
+            title = query.get("title", [None])[0]
+            found = [page for page in pages if page["title"] == title]
+        self._send({"results": [self._page(page) for page in found]})
+
+
+class FakeServer(ThreadingMixIn, HTTPServer):
+    # a local stand-in for the JIRA (root URL) and Confluence (/confluence)
+    # REST APIs; issue types derive from the ticket number and Confluence
+    # pages are kept in memory
+
+    daemon_threads = True
+
+    def __init__(self, port=0):
+        HTTPServer.__init__(self, ("127.0.0.1", port), FakeHandler)
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.requests = 0
+        # requests answered with a 503 before serving again
+        self.fail_next = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    @property
+    def confluence_url(self):
+        return self.url + CONFLUENCE_PATH
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from benchmarks.fake_server import FakeServer
+from benchmarks.synthetic import generate_repo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = OrderedDict([
+    ('small', dict(files=50, functions=5, commits=50)),
+    ('medium', dict(files=500, functions=10, commits=500)),
+    ('large', dict(files=2000, functions=10, commits=2000)),
+])
+
+# arguments are formatted with the repo path and the compared revisions
+COMMANDS = OrderedDict([
+    ('files_complexity', ['files_complexity', '{repo}', '--no-cache']),
+    ('files_maintainability', ['files_maintainability', '{repo}', '--no-cache']),
+    ('files_line_count', ['files_line_count', '{repo}', '--no-cache']),
+    ('average_complexity', ['average_complexity', '{repo}', '--no-cache']),
+    ('average_maintainability',
+     ['average_maintainability', '{repo}', '--no-cache']),
+    ('average_line_count', ['average_line_count', '{repo}', '--no-cache']),
+    ('analyze', ['analyze', '{repo}', '--no-cache']),
+    ('pylint_score', ['pylint_score', '{repo}', '--no-cache']),
+    ('recent_tags', ['recent_tags', '--path', '{repo}']),
+    ('jira_tickets', ['jira_tickets', '{start}', '{end}', '--path', '{repo}']),
+    ('bug_score',
+     ['bug_score', '{start}', '{end}', '--path', '{repo}', '--no-cache']),
+    ('hotspots',
+     ['hotspots', '{start}', '{end}', '--path', '{repo}', '--no-cache']),
+    ('metrics_diff',
+     ['metrics_diff', '{start}', '{end}', '--path', '{repo}', '--no-cache']),
+    ('metrics_trend', ['metrics_trend', '--path', '{repo}', '--no-cache']),
+    ('gate',
+     ['gate', '{start}', '--path', '{repo}', '--max-complexity', '5',
+      '--min-maintainability', '50', '--max-line-count', '200', '--no-cache']),
+])
+# exit statuses other than 0 that are a normal outcome of the command:
+# gate exits with 1 when files are past its thresholds and with 2 when it
+# is given none
+EXIT_STATUSES = {
+    'gate': (0, 1, 2),
+}
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def time_command(args, env, repeat, statuses=(0,)):
+    runs = []
+    for _ in range(repeat):
+        start = time.time()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'code_metrics.commands'] + args,
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, err = process.communicate()
+        runs.append(time.time() - start)
+        if process.returncode not in statuses:
+            raise RuntimeError("{} failed:\n{}".format(
+                " ".join(args), err.decode('utf-8', 'replace')))
+    return {'runs': runs, 'min': min(runs), 'median': _median(runs)}
+
+
+def command_env(server, cache_dir):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': os.pathsep.join(
+            [ROOT] + [p for p in [env.get('PYTHONPATH')] if p]),
+        'JIRA_URL': server.url,
+        'JIRA_USER': 'benchmark',
+        'JIRA_PASSWORD': 'benchmark',
+        'JIRA_PROJECT_ID': 'PROJ',
+        'CONFLUENCE_URL': server.confluence_url,
+        'CONFLUENCE_USER': 'benchmark',
+        'CONFLUENCE_PASSWORD': 'benchmark',
+        'CONFLUENCE_SPACE': 'BENCH',
+        'CODE_METRICS_CACHE_DIR': cache_dir,
+    })
+    return env
+
+
+def run_scale(name, params, commands, workdir, server, repeat):
+    repo = os.path.join(workdir, name)
+    generate_repo(repo, **params)
+    values = {'repo': repo, 'start': '1.1.0', 'end': 'master'}
+    env = command_env(server, os.path.join(workdir, 'cache'))
+    results = OrderedDict()
+    for command in commands:
+        args = [arg.format(**values) for arg in COMMANDS[command]]
+        results[command] = time_command(
+            args, env, repeat, EXIT_STATUSES.get(command, (0,)))
+        sys.stderr.write("{:>8} {:<24} {:8.3f}s\n".format(
+            name, command, results[command]['median']))
+    return {'params': params, 'commands': results}
+
+
+def compare(baseline, current, threshold):
+    # yields (scale, command, baseline, current, ratio, regressed)
+    for scale, scale_results in current['scales'].items():
+        base_scale = baseline.get('scales', {}).get(scale, {})
+        for command, timing in scale_results['commands'].items():
+            base = base_scale.get('commands', {}).get(command)
+            if not base:
+                continue
+            ratio = timing['median'] / base['median'] if base['median'] else 0
+            yield (scale, command, base['median'], timing['median'], ratio,
+                   ratio > threshold)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Times code_metrics commands on synthetic repositories.")
+    parser.add_argument('--scales', default='small',
+                        help="comma separated scales: {}".format(
+                            ", ".join(SCALES)))
+    parser.add_argument('--commands', default=",".join(COMMANDS),
+                        help="comma separated commands to time")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON results to compare to")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="slowdown ratio reported as a regression")
+    parser.add_argument('--workdir',
+                        help="keep the generated repositories in this directory")
+    options = parser.parse_args(argv)
+
+    workdir = options.workdir or tempfile.mkdtemp(prefix='code_metrics_bench')
+    server = FakeServer().start()
+    try:
+        results = OrderedDict([
+            ('python', platform.python_version()),
+            ('platform', platform.platform()),
+            ('timestamp', time.time()),
+            ('scales', OrderedDict()),
+        ])
+        for scale in options.scales.split(','):
+            results['scales'][scale] = run_scale(
+                scale, SCALES[scale], options.commands.split(','), workdir,
+                server, options.repeat)
+    finally:
+        server.stop()
+        if not options.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if not options.compare:
+        return 0
+
+    with open(options.compare) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = 0
+    for scale, command, before, after, ratio, regressed in compare(
+            baseline, results, options.threshold):
+        regressions += regressed
+        sys.stdout.write("{:<8} {:<24} {:8.3f}s -> {:8.3f}s  x{:.2f}{}\n".format(
+            scale, command, before, after, ratio,
+            "  REGRESSION" if regressed else ""))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from benchmarks.fake_server import FakeServer
+from benchmarks.run import COMMANDS, EXIT_STATUSES, _median, command_env
+from benchmarks.synthetic import generate_repo
+
+# small enough for the run to be dominated by the interpreter start and
+# the modules the command imports
+TINY_REPO = dict(files=2, functions=1, commits=4, tag_every=2)
+
+
+def import_stats(stderr):
+    # sums the self time of every module reported by python -X importtime
+    modules = 0
+    microseconds = 0
+    for line in stderr.decode('utf-8', 'replace').splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        modules += 1
+        microseconds += int(line.split(':', 1)[1].split('|')[0])
+    return modules, microseconds / 1e6
+
+
+def time_startup(args, env, repeat, statuses=(0,)):
+    runs, import_times = [], []
+    modules = 0
+    for _ in range(repeat):
+        start = time.time()
+        process = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-m', 'code_metrics.commands']
+            + args, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, err = process.communicate()
+        runs.append(time.time() - start)
+        if process.returncode not in statuses:
+            raise RuntimeError("{} failed:\n{}".format(
+                " ".join(args), err.decode('utf-8', 'replace')))
+        modules, seconds = import_stats(err)
+        import_times.append(seconds)
+    return {
+        'median': _median(runs),
+        'import_seconds': _median(import_times),
+        'modules': modules,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Times the startup and imports of every code_metrics "
+                    "command on a tiny repository.")
+    parser.add_argument('--commands', default=",".join(['--help'] + list(COMMANDS)),
+                        help="comma separated commands to time")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    options = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='code_metrics_startup')
+    server = FakeServer().start()
+    try:
+        repo = os.path.join(workdir, 'repo')
+        generate_repo(repo, **TINY_REPO)
+        values = {'repo': repo, 'start': '1.1.0', 'end': 'master'}
+        env = command_env(server, os.path.join(workdir, 'cache'))
+        results = OrderedDict()
+        for command in options.commands.split(','):
+            args = [arg.format(**values) for arg in COMMANDS.get(command, [command])]
+            results[command] = time_startup(
+                args, env, options.repeat, EXIT_STATUSES.get(command, (0,)))
+            sys.stdout.write("{:<24} {:8.3f}s  imports {:6.3f}s  {:5d} modules\n".format(
+                command, results[command]['median'],
+                results[command]['import_seconds'], results[command]['modules']))
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
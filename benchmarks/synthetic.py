@@ -0,0 +1,108 @@
+import os
+import random
+import subprocess
+
+TICKET_PREFIX = "PROJ"
+COMMITTER = "Benchmark <benchmark@example.com> {} +0000"
+FIRST_TIMESTAMP = 1500000000
+
+
+def generate_function(rnd, name, complexity):
+    lines = ["def {}(value, items):".format(name)]
+    indent = "    "
+    for branch in range(complexity):
+        kind = rnd.choice(("if", "for", "while"))
+        if kind == "if":
+            lines.append("{}if value > {}:".format(indent, branch))
+            lines.append("{}    value -= {}".format(indent, branch + 1))
+        elif kind == "for":
+            lines.append("{}for item in items:".format(indent))
+            lines.append("{}    value += item".format(indent))
+        else:
+            lines.append("{}while value > {}:".format(indent, branch * 10))
+            lines.append("{}    value //= 2".format(indent))
+        # nest every other branch to vary the shape of the code
+        if rnd.random() < 0.5:
+            indent += "    "
+    lines.append("    return value")
+    return "\n".join(lines)
+
+
+def generate_module(rnd, functions, max_complexity, revision=0):
+    parts = ['"""Synthetic module, revision {}."""'.format(revision)]
+    for index in range(functions):
+        complexity = rnd.randint(1, max_complexity)
+        parts.append(generate_function(
+            rnd, "function_{}".format(index), complexity))
+    return "\n\n\n".join(parts) + "\n"
+
+
+def module_path(index, files_per_package=20):
+    package = "package_{}".format(index // files_per_package)
+    return "{}/module_{}.py".format(package, index)
+
+
+def generate_tree(rnd, files, functions, max_complexity):
+    tree = {}
+    for index in range(files):
+        tree[module_path(index)] = generate_module(
+            rnd, functions, max_complexity)
+    packages = set(os.path.dirname(path) for path in tree)
+    for package in packages:
+        tree["{}/__init__.py".format(package)] = ""
+    return tree
+
+
+def _data(stream, content):
+    content = content.encode("utf-8")
+    stream.write("data {}\n".format(len(content)).encode("utf-8"))
+    stream.write(content)
+    stream.write(b"\n")
+
+
+def generate_repo(path, files=100, functions=10, max_complexity=8,
+                  commits=100, ticket_ratio=0.8, tag_every=25, seed=0):
+    # the first commit adds the whole tree, every following commit rewrites
+    # one module; most messages start with a PROJ-<n> ticket key and a
+    # version tag is added every tag_every commits
+    rnd = random.Random(seed)
+    tree = generate_tree(rnd, files, functions, max_complexity)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    subprocess.check_call(["git", "init", "-q", path])
+
+    process = subprocess.Popen(
+        ["git", "fast-import", "--quiet"], cwd=path, stdin=subprocess.PIPE)
+    stream = process.stdin
+    modules = sorted(name for name in tree if not name.endswith("__init__.py"))
+    tags = 0
+    for mark in range(1, commits + 1):
+        if mark == 1:
+            message, changes = "Initial tree", sorted(tree.items())
+        else:
+            name = rnd.choice(modules)
+            changes = [(name, generate_module(
+                rnd, functions + rnd.randint(0, 3), max_complexity, mark))]
+            message = "Update {}".format(name)
+            if rnd.random() < ticket_ratio:
+                message = "{}-{} {}".format(
+                    TICKET_PREFIX, rnd.randint(1, commits), message)
+        stream.write(b"commit refs/heads/master\n")
+        stream.write("mark :{}\n".format(mark).encode("utf-8"))
+        stream.write("committer {}\n".format(
+            COMMITTER.format(FIRST_TIMESTAMP + mark * 60)).encode("utf-8"))
+        _data(stream, message)
+        if mark > 1:
+            stream.write("from :{}\n".format(mark - 1).encode("utf-8"))
+        for name, content in changes:
+            stream.write("M 100644 inline {}\n".format(name).encode("utf-8"))
+            _data(stream, content)
+        if mark % tag_every == 0 or mark == commits:
+            tags += 1
+            stream.write("reset refs/tags/1.{}.0\n".format(tags).encode("utf-8"))
+            stream.write("from :{}\n\n".format(mark).encode("utf-8"))
+    stream.close()
+    if process.wait() != 0:
+        raise RuntimeError("git fast-import failed in {}".format(path))
+    subprocess.check_call(["git", "checkout", "-q", "-f", "master"], cwd=path)
+    return path
@@ -0,0 +1,141 @@
+import bisect
+
+SUMMARY_PERCENTILES = (0.5, 0.9, 0.99)
+# percentiles are exact up to this many values, P-square is not accurate
+# in the tails of short streams
+EXACT_VALUES = 1000
+
+
+def exact_quantile(sorted_values, quantile):
+    # interpolated between the closest ranks, the way numpy.percentile does
+    if not sorted_values:
+        return None
+    rank = quantile * (len(sorted_values) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (
+        sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+class P2Quantile(object):
+    # estimates a quantile in constant memory with the P-square algorithm
+    # (Jain & Chlamtac, 1985): five markers track the minimum, the maximum,
+    # the quantile itself and two midpoints, and are moved along a parabola
+    # as values stream in
+
+    def __init__(self, quantile):
+        assert 0 < quantile < 1, "quantile must be between 0 and 1"
+        self.quantile = quantile
+        self._heights = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [
+            0, 2 * quantile, 4 * quantile, 2 + 2 * quantile, 4]
+        self._increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value):
+        heights = self._heights
+        if len(heights) < 5:
+            bisect.insort(heights, value)
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = bisect.bisect_right(heights, value) - 1
+        for index in range(cell + 1, 5):
+            self._positions[index] += 1
+        for index in range(5):
+            self._desired[index] += self._increments[index]
+
+        positions = self._positions
+        for index in range(1, 4):
+            offset = self._desired[index] - positions[index]
+            if ((offset >= 1 and positions[index + 1] - positions[index] > 1) or
+                    (offset <= -1 and positions[index - 1] - positions[index] < -1)):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(index, step)
+                if not heights[index - 1] < height < heights[index + 1]:
+                    height = self._linear(index, step)
+                heights[index] = height
+                positions[index] += step
+
+    def _parabolic(self, index, step):
+        heights, positions = self._heights, self._positions
+        return heights[index] + float(step) / (
+            positions[index + 1] - positions[index - 1]) * (
+                (positions[index] - positions[index - 1] + step) *
+                (heights[index + 1] - heights[index]) /
+                (positions[index + 1] - positions[index]) +
+                (positions[index + 1] - positions[index] - step) *
+                (heights[index] - heights[index - 1]) /
+                (positions[index] - positions[index - 1]))
+
+    def _linear(self, index, step):
+        heights, positions = self._heights, self._positions
+        return heights[index] + step * float(
+            heights[index + step] - heights[index]) / (
+                positions[index + step] - positions[index])
+
+    @property
+    def value(self):
+        if len(self._heights) < 5 or self._positions[4] == 4:
+            return exact_quantile(self._heights, self.quantile)
+        return self._heights[2]
+
+
+class RunningStats(object):
+    # count, mean, min, max and percentiles of a stream of values; only the
+    # first EXACT_VALUES values are kept, longer streams get P-square estimates
+
+    def __init__(self, percentiles=SUMMARY_PERCENTILES):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.percentiles = [P2Quantile(quantile) for quantile in percentiles]
+        self._values = []
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        for estimator in self.percentiles:
+            estimator.add(value)
+        if self._values is not None:
+            bisect.insort(self._values, value)
+            if len(self._values) > EXACT_VALUES:
+                self._values = None
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / float(self.count)
+
+    def summary(self):
+        # (name, value) pairs, e.g. ('p90', 12.5)
+        rows = [
+            ('count', self.count),
+            ('mean', self.mean),
+            ('min', self.min),
+            ('max', self.max),
+        ]
+        for estimator in self.percentiles:
+            if self._values is not None:
+                value = exact_quantile(self._values, estimator.quantile)
+            else:
+                value = estimator.value
+            rows.append(('p{:g}'.format(estimator.quantile * 100), value))
+        return rows
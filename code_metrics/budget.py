@@ -0,0 +1,242 @@
+import heapq
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.connection import wait
+
+from code_metrics.utils import parallel_map
+
+# a worker is killed once a file kept it busy for WALL_FACTOR times the
+# cpu time limit plus WALL_GRACE seconds: files stuck in C code or waiting
+# without using the cpu never reach the cpu timer, and the margin leaves
+# it to stop the files sharing the cpus with other workers
+WALL_FACTOR = 2
+WALL_GRACE = 1.0
+# seconds a worker gets to exit once there is nothing left to analyze
+WORKER_EXIT_TIMEOUT = 5.0
+
+# set in the budget_map workers, to tell the parent the file they are on
+_worker = {}
+
+
+class FileTimeout(BaseException):
+    # a BaseException, so the except Exception clauses of radon and pylint
+    # let it through like a KeyboardInterrupt
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise FileTimeout()
+
+
+def can_interrupt():
+    # timers can only interrupt the main thread, and not on windows
+    return (hasattr(signal, 'setitimer') and
+            threading.current_thread() is threading.main_thread())
+
+
+def restart_timer(seconds, filename=None):
+    # called when the analysis moves on to another file, which gets the
+    # whole time limit again
+    if seconds and can_interrupt():
+        signal.setitimer(signal.ITIMER_PROF, seconds)
+    if 'connection' in _worker:
+        _worker['connection'].send(('file', filename))
+
+
+@contextmanager
+def time_limit(seconds):
+    # raises FileTimeout in the block once it used seconds of cpu time, so
+    # workers sharing the cpus are not penalized; the timer can be
+    # restarted from within with restart_timer
+    if not seconds or not can_interrupt():
+        yield
+        return
+    previous = signal.signal(signal.SIGPROF, _raise_timeout)
+    signal.setitimer(signal.ITIMER_PROF, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, previous)
+
+
+def size_exceeded(filename, max_bytes):
+    # the reason to skip a file too large to analyze, or None
+    if not max_bytes:
+        return None
+    try:
+        size = os.path.getsize(filename)
+    except OSError:
+        return None
+    if size <= max_bytes:
+        return None
+    return "{} KB over the {} KB limit".format(size // 1024, max_bytes // 1024)
+
+
+def timeout_reason(max_seconds):
+    return "analysis stopped after {:g}s of cpu time".format(max_seconds)
+
+
+def wall_limit(max_seconds):
+    return max_seconds * WALL_FACTOR + WALL_GRACE
+
+
+def killed_reason(max_seconds):
+    return "worker killed after {:g}s without finishing".format(
+        wall_limit(max_seconds))
+
+
+def _serve(connection, func):
+    # the loop of a budget_map worker: one item at a time, so the parent
+    # always knows which one a worker it kills was on
+    _worker['connection'] = connection
+    for index, item in iter(connection.recv, None):
+        try:
+            result = ('done', index, func(item))
+        except Exception as error: # pylint: disable=broad-except
+            result = ('error', index, error)
+        connection.send(result)
+
+
+class _Worker(object):
+
+    def __init__(self, func):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_serve, args=(child, func))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.task = None
+        self.filename = None
+        self.deadline = None
+
+    def start(self, task, seconds):
+        self.connection.send(task)
+        self.task = task
+        self.filename = None
+        self.deadline = time.time() + seconds
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except (IOError, OSError):
+            pass
+        self.process.join(WORKER_EXIT_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+
+
+def budget_map(func, items, jobs, max_seconds, on_timeout):
+    # same as parallel_map, in worker processes even with a single job: a
+    # worker still busy with a file past the wall clock limit is killed and
+    # replaced, and on_timeout(item, filename, reason) gives the result of
+    # the item it was on; filename is the last one the worker passed to
+    # restart_timer, or None
+    items = list(items)
+    if not max_seconds or not items:
+        for result in parallel_map(func, items, jobs):
+            yield result
+        return
+    limit = wall_limit(max_seconds)
+    tasks = iter(enumerate(items))
+    workers = [_Worker(func) for _ in range(min(jobs or 1, len(items)))]
+    results = {}
+    next_index = 0
+    try:
+        while next_index < len(items):
+            for worker in workers:
+                task = next(tasks, None) if worker.task is None else None
+                if task is not None:
+                    worker.start(task, limit)
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+            busy = [worker for worker in workers if worker.task is not None]
+            if not busy:
+                continue
+            timeout = max(0, min(worker.deadline for worker in busy) - time.time())
+            ready = wait([worker.connection for worker in busy], timeout)
+            for position, worker in enumerate(workers):
+                if worker.task is None:
+                    continue
+                index, item = worker.task
+                if worker.connection in ready:
+                    try:
+                        message = worker.connection.recv()
+                    except EOFError:
+                        message = ('exit', worker.process.exitcode)
+                    if message[0] == 'file':
+                        worker.filename = message[1]
+                        worker.deadline = time.time() + limit
+                        continue
+                    if message[0] == 'done':
+                        results[index] = message[2]
+                        worker.task = None
+                        continue
+                    if message[0] == 'error':
+                        raise message[2]
+                    # the worker died, e.g. killed by the system
+                    reason = None
+                elif time.time() >= worker.deadline:
+                    reason = killed_reason(max_seconds)
+                else:
+                    continue
+                worker.kill()
+                reason = reason or "worker exited with status {}".format(
+                    worker.process.exitcode)
+                results[index] = on_timeout(item, worker.filename, reason)
+                workers[position] = _Worker(func)
+    finally:
+        for worker in workers:
+            worker.close()
+
+
+class FileBudget(object):
+    # the limits a file is analyzed within, and what they cost: the files
+    # skipped and the slowest ones analyzed
+
+    def __init__(self, max_bytes=None, max_seconds=None, slowest=0):
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.slowest_count = slowest
+        self.skipped = []
+        self._slowest = []
+
+    @property
+    def active(self):
+        return bool(self.max_bytes or self.max_seconds or self.slowest_count)
+
+    @property
+    def limits(self):
+        # what the workers need to know, in a picklable form
+        return self.max_bytes, self.max_seconds
+
+    def skip(self, filename, reason):
+        self.skipped.append((filename, reason))
+
+    def record(self, filename, seconds):
+        if not self.slowest_count:
+            return
+        item = (seconds, filename)
+        if len(self._slowest) < self.slowest_count:
+            heapq.heappush(self._slowest, item)
+        elif item > self._slowest[0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def slowest(self):
+        return [
+            (filename, seconds)
+            for seconds, filename in sorted(self._slowest, reverse=True)
+        ]
@@ -1,29 +1,61 @@
 import collections
 import re
-from code_metrics.jira_utils import JiraClient
+import sqlite3
+import threading
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+from code_metrics.jira_utils import JiraClient, KEYS_PER_QUERY, SEARCH_THREADS
 from code_metrics.git_utils import (
-    get_repo, get_commit_files, get_revision)
+    get_repo, get_revision, iter_commits_messages, iter_commits_stats,
+    iter_selected_commits_stats)
+from code_metrics.ticket_index import TicketIndex
 
 
-def get_ticket_commits(repo_path, from_commit, to_commit):
-    revision = get_revision(from_commit, to_commit)
+def open_ticket_index(repo):
+    # None when the index cannot be written, e.g. in a read-only clone
+    try:
+        return TicketIndex.open(repo)
+    except (OSError, sqlite3.Error):
+        return None
+
+
+def get_ticket_commits(repo_path, from_commit, to_commit, jira_client=None):
+    # sha -> ticket key of the commits in the range
     repo = get_repo(repo_path)
-    jira_client = JiraClient.from_environment()
+    jira_client = jira_client or JiraClient.from_environment()
+    index = open_ticket_index(repo)
+    if index is not None:
+        with index:
+            return index.ticket_commits(
+                repo, from_commit, to_commit, jira_client.ticket_pattern)
+
+    revision = get_revision(from_commit, to_commit)
     ticket_commits = {}
-    for commit in repo.iter_commits(revision):
+    for commit in iter_commits_messages(repo, revision):
         ticket_name = jira_client.get_issue_key(commit.message)
         if not ticket_name:
             continue
-        ticket_commits[commit.binsha] = ticket_name
+        ticket_commits[commit.hexsha] = ticket_name
     return ticket_commits
 
 
-def build_bug_score_data(repo, commits, ignore=None):
+def iter_ticket_commits_stats(repo, revision, jira_client):
+    for commit in iter_commits_stats(repo, revision):
+        ticket_name = jira_client.get_issue_key(commit.message)
+        if not ticket_name:
+            continue
+        yield ticket_name, commit
+
+
+def build_bug_score_data(commits, ignore=None):
+    # commits is an iterable of (ticket name, commit stats) pairs
     files_changed = collections.defaultdict(dict)
 
-    for commit, ticket_name in commits.items():
-        files_stats = get_commit_files(repo, commit)
-        for file_path, stats in files_stats.items():
+    for ticket_name, commit in commits:
+        for file_path, stats in commit.files.items():
             if ignore and re.match(ignore, file_path):
                 continue
             file_data = files_changed[file_path]
@@ -40,19 +72,93 @@ def build_bug_score_data(repo, commits, ignore=None):
     return files_changed
 
 
-def get_bug_score(repo_path, from_commit, to_commit, ignore=None):
-    ticket_commits = get_ticket_commits(repo_path, from_commit, to_commit)
-    tickets_found = ticket_commits.values()
+class BugLookup(threading.Thread):
+    # resolves batches of ticket keys in the background while
+    # the git history is still being read
 
-    # interogate JIRA for bug type tickets
-    jira_client = JiraClient.from_environment()
-    bug_tickets = set(jira_client.filter_bugs(tickets_found))
+    batch_size = KEYS_PER_QUERY * SEARCH_THREADS
 
-    bug_commits = {}
-    for commit_sha, ticket in ticket_commits.items():
-        if ticket in bug_tickets:
-            bug_commits[commit_sha] = ticket
+    def __init__(self, jira_client):
+        super(BugLookup, self).__init__()
+        self.daemon = True
+        self.jira_client = jira_client
+        self.bug_tickets = set()
+        self.error = None
+        self._seen = set()
+        self._pending = []
+        self._batches = Queue()
+
+    def add(self, ticket_name):
+        if ticket_name in self._seen:
+            return
+        self._seen.add(ticket_name)
+        self._pending.append(ticket_name)
+        if len(self._pending) >= self.batch_size:
+            self._batches.put(self._pending)
+            self._pending = []
+
+    def run(self):
+        for batch in iter(self._batches.get, None):
+            if self.error is not None:
+                continue
+            try:
+                self.bug_tickets.update(self.jira_client.filter_bugs(batch))
+            except Exception as error: # pylint: disable=broad-except
+                self.error = error
+
+    def finish(self):
+        if self._pending:
+            self._batches.put(self._pending)
+            self._pending = []
+        self._batches.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.bug_tickets
+
+
+def _bug_commits(ticket_commits, lookup):
+    # the (ticket, commit stats) pairs of bug tickets, known once the
+    # lookup resolved the tickets of every commit
+    selected = []
+    try:
+        for ticket, commit in ticket_commits:
+            selected.append((ticket, commit))
+            lookup.add(ticket)
+    finally:
+        bug_tickets = lookup.finish()
+    return [
+        (ticket, commit)
+        for ticket, commit in selected
+        if ticket in bug_tickets
+    ]
+
+
+def get_bug_score(repo_path, from_commit, to_commit, ignore=None,
+                  jira_client=None):
+    revision = get_revision(from_commit, to_commit)
+    jira_client = jira_client or JiraClient.from_environment()
+    repo = get_repo(repo_path)
 
-    data = build_bug_score_data(get_repo(repo_path), bug_commits, ignore=ignore)
+    index = open_ticket_index(repo)
+    if index is None:
+        tickets = []
+        commits = iter_ticket_commits_stats(repo, revision, jira_client)
+    else:
+        # the tickets of the range are known upfront, so they are all sent
+        # to JIRA before git starts diffing their commits
+        with index:
+            ticket_commits = index.ticket_commits(
+                repo, from_commit, to_commit, jira_client.ticket_pattern)
+        tickets = sorted(set(ticket_commits.values()))
+        commits = (
+            (ticket_commits[commit.hexsha], commit)
+            for commit in iter_selected_commits_stats(repo, ticket_commits)
+        )
 
-    return data
+    # interogate JIRA for bug type tickets while the commits stream in
+    lookup = BugLookup(jira_client)
+    lookup.start()
+    for ticket in tickets:
+        lookup.add(ticket)
+    return build_bug_score_data(_bug_commits(commits, lookup), ignore=ignore)
@@ -0,0 +1,139 @@
+import errno
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 200000
+# seconds to wait for another process holding the write lock
+BUSY_TIMEOUT = 5.0
+
+
+def default_cache_dir():
+    cache_dir = os.environ.get("CODE_METRICS_CACHE_DIR")
+    if cache_dir:
+        return cache_dir
+    return os.path.join(os.path.expanduser("~"), ".cache", "code_metrics")
+
+
+class Cache(object):
+
+    def __init__(self, path, name, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.name = name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._accessed = set()
+        self._connection = None
+        # the cache may be handed over to a worker thread, e.g. JIRA lookups
+        self._lock = threading.Lock()
+        try:
+            # every write commits on its own, so the write lock is only held
+            # for a moment and other processes can use the cache meanwhile;
+            # in WAL mode readers do not wait for writers at all
+            self._connection = sqlite3.connect(
+                path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+            )
+        except sqlite3.Error as error:
+            self._disable(error)
+
+    @classmethod
+    def open(cls, name, cache_dir=None, **kwargs):
+        cache_dir = cache_dir or default_cache_dir()
+        try:
+            os.makedirs(cache_dir)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        return cls(os.path.join(cache_dir, "{}.sqlite".format(name)), name, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __str__(self):
+        return "{} cache: {} hits, {} misses".format(
+            self.name, self.hits, self.misses)
+
+    def _disable(self, error):
+        # a cache another process keeps locked is not worth failing for:
+        # the run goes on without it
+        sys.stderr.write("{} cache disabled: {}\n".format(self.name, error))
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except sqlite3.Error:
+                pass
+        self._connection = None
+
+    def get(self, key, max_age=None):
+        row = None
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    row = self._connection.execute(
+                        "SELECT value, created FROM entries WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as error:
+                    self._disable(error)
+        expired = max_age is not None and row and time.time() - row[1] > max_age
+        if row is None or expired:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._accessed.add(key)
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, created, accessed) "
+                    "VALUES (?, ?, ?, ?)", (key, json.dumps(value), now, now)
+                )
+            except sqlite3.Error as error:
+                self._disable(error)
+
+    def evict(self):
+        # drop the least recently used entries above the size bound
+        self._connection.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM entries ORDER BY accessed DESC "
+            "LIMIT -1 OFFSET ?)", (self.max_entries,)
+        )
+
+    def close(self):
+        if self._connection is None:
+            return
+        now = time.time()
+        try:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "UPDATE entries SET accessed = ? WHERE key = ?",
+                [(now, key) for key in self._accessed]
+            )
+            self._accessed.clear()
+            self.evict()
+            self._connection.execute("COMMIT")
+            self._connection.close()
+        except sqlite3.Error as error:
+            self._disable(error)
+        self._connection = None
@@ -1,17 +1,146 @@
+try:
+    from cStringIO import StringIO
+except ImportError:
+    try:
+        from StringIO import StringIO
+    except ImportError:
+        from io import StringIO
+
+import itertools
+import os
+import shlex
 import sys
-from mando import command, main, arg
+import time
+from contextlib import contextmanager
+from mando import command, main as program, arg, parse
 
-from code_metrics import pylint_metrics
-from code_metrics import radon_metrics
-from code_metrics import bug_metrics
-from code_metrics import git_utils
+# the metrics modules pull in pylint, radon, GitPython and the jira client,
+# so each command imports only the ones it uses to keep the startup fast
+from code_metrics import profiling
 from code_metrics import utils
-from code_metrics.formatters import as_table
+from code_metrics.cache import Cache
+from code_metrics.formatters import write_table
+
+program.option(
+    '--profile', action='store_true',
+    help="report the time spent in each stage and the work counters as JSON")
+program.option(
+    '--profile-output', metavar='PATH', default=None,
+    help="write the --profile report to PATH instead of stderr")
+program.option(
+    '--cprofile', metavar='PATH', default=None,
+    help="run the command under cProfile and dump its stats to PATH")
+
+
+# caches and JIRA connection opened once and shared by the commands of a
+# batch
+_shared = {}
+
+
+@contextmanager
+def _open_cache(name, no_cache=False, cache_dir=None):
+    if no_cache:
+        yield None
+        return
+    if 'caches' in _shared:
+        if name not in _shared['caches']:
+            _shared['caches'][name] = Cache.open(name, _shared['cache_dir'])
+        yield _shared['caches'][name]
+        return
+    with Cache.open(name, cache_dir) as cache:
+        yield cache
+    sys.stderr.write('{}\n'.format(cache))
+
+
+@contextmanager
+def _jira_client(no_cache=False, cache_dir=None, cache_ttl=None,
+                 offline=False):
+    from code_metrics.jira_utils import JiraClient
+    # the commands of a batch share the connection, not their options
+    options = {'offline': offline, 'client': _shared.get('jira')}
+    if cache_ttl is not None:
+        options['cache_ttl'] = cache_ttl * 3600
+    with _open_cache('jira', no_cache, cache_dir) as jira_cache:
+        jira_client = JiraClient.from_environment(cache=jira_cache, **options)
+        yield jira_client
+        if 'caches' in _shared and jira_client.connected:
+            _shared['jira'] = jira_client.client
+
+
+def _daemon_files_metrics(paths, ignore, cache_dir=None):
+    # the metrics held by a daemon serving the same tree, None if none runs.
+    # They stream in one file at a time; the first one is read here so a
+    # daemon failing to answer leaves the files to be analyzed locally
+    from code_metrics import daemon
+    client = daemon.DaemonClient.connect(
+        daemon.socket_path(paths, ignore, cache_dir))
+    if client is None:
+        return None
+    files_metrics = _iter_daemon_files(client)
+    try:
+        first = list(itertools.islice(files_metrics, 1))
+    except (IOError, OSError, RuntimeError) as error:
+        sys.stderr.write("metrics daemon failed: {}\n".format(error))
+        return None
+    return itertools.chain(first, files_metrics)
+
+
+def _iter_daemon_files(client):
+    with client:
+        for filename, metrics in client.iter_files_metrics():
+            yield filename, metrics
+
+
+def _file_budget(max_file_size=None, file_timeout=None, slowest=None):
+    from code_metrics.budget import FileBudget
+    return FileBudget(
+        max_file_size * 1024 if max_file_size else None, file_timeout,
+        slowest or 0)
+
+
+def _write_budget_report(budget):
+    # on stderr, so the table written on stdout can still be parsed
+    if budget.skipped:
+        sys.stderr.write("\nSkipped files:\n")
+        write_table(budget.skipped, ['File', 'Reason'], 'plain', sys.stderr)
+        sys.stderr.write("\n")
+    if budget.slowest_count:
+        sys.stderr.write("\nSlowest files:\n")
+        write_table(budget.slowest(), ['File', 'Seconds'], 'plain', sys.stderr)
+        sys.stderr.write("\n")
+
+
+@contextmanager
+def _files_metrics(paths, ignore, no_cache=False, cache_dir=None, jobs=None,
+                   budget=None):
+    from code_metrics import radon_metrics
+    budget = budget or _file_budget()
+    # the daemon analyzes every file without limits or timings
+    files_metrics = None if no_cache or budget.active else _daemon_files_metrics(
+        paths, ignore, cache_dir)
+    if files_metrics is not None:
+        yield files_metrics
+        return
+    with _open_cache('radon', no_cache, cache_dir) as radon_cache:
+        yield radon_metrics.iter_files_metrics(
+            paths, ignore, radon_cache, jobs or utils.cpu_count(), budget)
+    _write_budget_report(budget)
+
+
+def _write_summary(stats, summary=False, fmt=u'csv'):
+    if not summary:
+        sys.stdout.write(str(stats.mean))
+        return
+    names, values = zip(*stats.summary())
+    write_table([values], [name.capitalize() for name in names],
+                table_format=fmt)
 
 
 @command
 @arg('paths', nargs='+')
-def average_complexity(paths, ignore=None):
+def average_complexity(paths, ignore=None, no_cache=False, cache_dir=None,
+                       jobs=None, summary=False, fmt=u'csv',
+                       max_file_size=None, file_timeout=None, slowest=None):
     '''Shows average complexity score.
 
     The lower the score is, the lower the quality.
@@ -24,15 +153,39 @@ def average_complexity(paths, ignore=None):
     :param -i, --ignore <str>: Ignore directories when their name matches one
         of these glob patterns: radon won't even descend into them. By default,
         hidden directories (starting with '.') are ignored.
+    :param --no-cache: Analyze every file again instead of reusing the
+        results cached for unchanged files.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -j, --jobs <int>: Number of worker processes used to analyze the
+        files (default: number of CPUs).
+    :param --summary: Show the file count, mean, min, max and the 50th, 90th
+        and 99th percentiles instead of the mean alone.
+    :param -f, --fmt <str>: set output table format; supported formats:
+      plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param --max-file-size <int>: Skip the files larger than this many
+        kilobytes.
+    :param --file-timeout <float>: Stop analyzing a file after this many
+        seconds of cpu time and skip it.
+    :param --slowest <int>: Show the N files that took the most cpu time to
+        analyze.
     '''
+    from code_metrics import radon_metrics
 
-    data = radon_metrics.get_files_complexity_data(paths, ignore) or {}
-    sys.stdout.write(str(utils.average(data.values())))
+    budget = _file_budget(max_file_size, file_timeout, slowest)
+    with _files_metrics(
+            paths, ignore, no_cache, cache_dir, jobs, budget) as metrics:
+        stats = radon_metrics.aggregate_files_metric(
+            paths, ignore, 'complexity', metrics)
+    _write_summary(stats, summary, fmt)
 
 
 @command
 @arg('paths', nargs='+')
-def average_line_count(paths, ignore=None):
+def average_line_count(paths, ignore=None, no_cache=False, cache_dir=None,
+                       jobs=None, summary=False, fmt=u'csv',
+                       max_file_size=None, file_timeout=None, slowest=None):
     '''Shows the average of physical lines count.
 
     Uses radon to collect lines of code for each file.
@@ -42,14 +195,38 @@ def average_line_count(paths, ignore=None):
     :param -i, --ignore <str>: Ignore directories when their name matches one
         of these glob patterns: radon won't even descend into them. By default,
         hidden directories (starting with '.') are ignored.
+    :param --no-cache: Analyze every file again instead of reusing the
+        results cached for unchanged files.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -j, --jobs <int>: Number of worker processes used to analyze the
+        files (default: number of CPUs).
+    :param --summary: Show the file count, mean, min, max and the 50th, 90th
+        and 99th percentiles instead of the mean alone.
+    :param -f, --fmt <str>: set output table format; supported formats:
+      plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param --max-file-size <int>: Skip the files larger than this many
+        kilobytes.
+    :param --file-timeout <float>: Stop analyzing a file after this many
+        seconds of cpu time and skip it.
+    :param --slowest <int>: Show the N files that took the most cpu time to
+        analyze.
     '''
-    data = radon_metrics.get_files_lines_of_code(paths, ignore) or {}
-    sys.stdout.write(str(utils.average(data.values())))
+    from code_metrics import radon_metrics
+    budget = _file_budget(max_file_size, file_timeout, slowest)
+    with _files_metrics(
+            paths, ignore, no_cache, cache_dir, jobs, budget) as metrics:
+        stats = radon_metrics.aggregate_files_metric(
+            paths, ignore, 'loc', metrics)
+    _write_summary(stats, summary, fmt)
 
 
 @command
 @arg('paths', nargs='+')
-def average_maintainability(paths, ignore=None):
+def average_maintainability(paths, ignore=None, no_cache=False,
+                            cache_dir=None, jobs=None, summary=False, fmt=u'csv',
+                            max_file_size=None, file_timeout=None, slowest=None):
     '''Shows average maintainability score.
 
     The higher the score is, the better the quality.
@@ -61,14 +238,38 @@ def average_maintainability(paths, ignore=None):
     :param -i, --ignore <str>: Ignore directories when their name matches one
         of these glob patterns: radon won't even descend into them. By default,
         hidden directories (starting with '.') are ignored.
+    :param --no-cache: Analyze every file again instead of reusing the
+        results cached for unchanged files.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -j, --jobs <int>: Number of worker processes used to analyze the
+        files (default: number of CPUs).
+    :param --summary: Show the file count, mean, min, max and the 50th, 90th
+        and 99th percentiles instead of the mean alone.
+    :param -f, --fmt <str>: set output table format; supported formats:
+      plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param --max-file-size <int>: Skip the files larger than this many
+        kilobytes.
+    :param --file-timeout <float>: Stop analyzing a file after this many
+        seconds of cpu time and skip it.
+    :param --slowest <int>: Show the N files that took the most cpu time to
+        analyze.
     '''
-    data = radon_metrics.get_files_maintainability_data(paths, ignore) or {}
-    sys.stdout.write(str(utils.average(data.values())))
+    from code_metrics import radon_metrics
+    budget = _file_budget(max_file_size, file_timeout, slowest)
+    with _files_metrics(
+            paths, ignore, no_cache, cache_dir, jobs, budget) as metrics:
+        stats = radon_metrics.aggregate_files_metric(
+            paths, ignore, 'maintainability', metrics)
+    _write_summary(stats, summary, fmt)
 
 
 @command
 @arg('paths', nargs='+')
-def files_complexity(paths, ignore=None, limit=None, fmt=u'csv'):
+def files_complexity(paths, ignore=None, no_cache=False, cache_dir=None,
+                     jobs=None, limit=None, fmt=u'csv', max_file_size=None,
+                     file_timeout=None, slowest=None):
     '''Shows complexity scores per file.
 
     The lower the score is, the lower the quality.
@@ -83,24 +284,39 @@ def files_complexity(paths, ignore=None, limit=None, fmt=u'csv'):
     :param -i, --ignore <str>: Ignore directories when their name matches one
         of these glob patterns: radon won't even descend into them. By default,
         hidden directories (starting with '.') are ignored.
+    :param --no-cache: Analyze every file again instead of reusing the
+        results cached for unchanged files.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -j, --jobs <int>: Number of worker processes used to analyze the
+        files (default: number of CPUs).
     :param -l, --limit <int>: max no of rows to display
     :param -f, --fmt <str>: set output table format; supported formats:
       plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
-      latex, latex_booktabs, tsv, csv (default: csv)
-
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param --max-file-size <int>: Skip the files larger than this many
+        kilobytes.
+    :param --file-timeout <float>: Stop analyzing a file after this many
+        seconds of cpu time and skip it.
+    :param --slowest <int>: Show the N files that took the most cpu time to
+        analyze.
     '''
+    from code_metrics import radon_metrics
 
-    data = radon_metrics.get_files_complexity_data(paths, ignore) or {}
-    rows = data.items()[:limit] if limit else data.items()
+    budget = _file_budget(max_file_size, file_timeout, slowest)
+    with _files_metrics(
+            paths, ignore, no_cache, cache_dir, jobs, budget) as metrics:
+        data = radon_metrics.get_files_complexity_data(
+            paths, ignore, metrics, limit) or {}
 
-    sys.stdout.write(
-        as_table(rows, ['File', 'Complexity score'], table_format=fmt)
-    )
+    write_table(data.items(), ['File', 'Complexity score'], table_format=fmt)
 
 
 @command
 @arg('paths', nargs='+')
-def files_maintainability(paths, ignore=None, limit=None, fmt=u'csv'):
+def files_maintainability(paths, ignore=None, no_cache=False, cache_dir=None,
+                          jobs=None, limit=None, fmt=u'csv',
+                          max_file_size=None, file_timeout=None, slowest=None):
     '''Shows maintainability score per file.
 
     The higher the score is, the better the quality.
@@ -113,22 +329,39 @@ def files_maintainability(paths, ignore=None, limit=None, fmt=u'csv'):
     :param -i, --ignore <str>: Ignore directories when their name matches one
         of these glob patterns: radon won't even descend into them. By default,
         hidden directories (starting with '.') are ignored.
+    :param --no-cache: Analyze every file again instead of reusing the
+        results cached for unchanged files.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -j, --jobs <int>: Number of worker processes used to analyze the
+        files (default: number of CPUs).
     :param -l, --limit <int>: max no of rows to display
     :param -f, --fmt <str>: set output table format; supported formats:
       plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
-      latex, latex_booktabs, tsv, csv (default: csv)
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param --max-file-size <int>: Skip the files larger than this many
+        kilobytes.
+    :param --file-timeout <float>: Stop analyzing a file after this many
+        seconds of cpu time and skip it.
+    :param --slowest <int>: Show the N files that took the most cpu time to
+        analyze.
     '''
-    data = radon_metrics.get_files_maintainability_data(paths, ignore) or {}
-    rows = data.items()[:limit] if limit else data.items()
+    from code_metrics import radon_metrics
+    budget = _file_budget(max_file_size, file_timeout, slowest)
+    with _files_metrics(
+            paths, ignore, no_cache, cache_dir, jobs, budget) as metrics:
+        data = radon_metrics.get_files_maintainability_data(
+            paths, ignore, metrics, limit) or {}
 
-    sys.stdout.write(
-        as_table(rows, ['File', 'Maintainability score'], table_format=fmt)
-    )
+    write_table(
+        data.items(), ['File', 'Maintainability score'], table_format=fmt)
 
 
 @command
 @arg('paths', nargs='+')
-def files_line_count(paths, ignore=None, limit=None, fmt=u'csv'):
+def files_line_count(paths, ignore=None, no_cache=False, cache_dir=None,
+                     jobs=None, limit=None, fmt=u'csv', max_file_size=None,
+                     file_timeout=None, slowest=None):
     '''Shows the number of physical lines count per file.
 
     Uses radon to collect lines of code for each file.
@@ -140,29 +373,261 @@ def files_line_count(paths, ignore=None, limit=None, fmt=u'csv'):
     :param -i, --ignore <str>: Ignore directories when their name matches one
         of these glob patterns: radon won't even descend into them. By default,
         hidden directories (starting with '.') are ignored.
+    :param --no-cache: Analyze every file again instead of reusing the
+        results cached for unchanged files.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -j, --jobs <int>: Number of worker processes used to analyze the
+        files (default: number of CPUs).
     :param -l, --limit <int>: max no of rows to display
     :param -f, --fmt <str>: set output table format; supported formats:
       plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
-      latex, latex_booktabs, tsv, csv (default: csv)
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param --max-file-size <int>: Skip the files larger than this many
+        kilobytes.
+    :param --file-timeout <float>: Stop analyzing a file after this many
+        seconds of cpu time and skip it.
+    :param --slowest <int>: Show the N files that took the most cpu time to
+        analyze.
     '''
-    data = radon_metrics.get_files_lines_of_code(paths, ignore) or {}
-    rows = data.items()[:limit] if limit else data.items()
+    from code_metrics import radon_metrics
+    budget = _file_budget(max_file_size, file_timeout, slowest)
+    with _files_metrics(
+            paths, ignore, no_cache, cache_dir, jobs, budget) as metrics:
+        data = radon_metrics.get_files_lines_of_code(
+            paths, ignore, metrics, limit) or {}
 
-    sys.stdout.write(
-        as_table(rows, ['File', 'Physical lines of code'], table_format=fmt)
-    )
+    write_table(
+        data.items(), ['File', 'Physical lines of code'], table_format=fmt)
 
 
 @command
 @arg('paths', nargs='+')
-def pylint_score(paths, rcfile=None):
+def analyze(paths, ignore=None, no_cache=False, cache_dir=None, jobs=None,
+            fmt=u'csv', max_file_size=None,
+            file_timeout=None, slowest=None):
+    '''Shows complexity, maintainability and line count per file.
+
+    Every file is read and parsed only once and all scores are
+    computed from that single pass. Files are sorted by their path.
+    The default output is in CSV format.
+
+    :param paths: The paths where to find modules or packages to analyze. More
+        than one path is allowed.
+    :param -i, --ignore <str>: Ignore directories when their name matches one
+        of these glob patterns: radon won't even descend into them. By default,
+        hidden directories (starting with '.') are ignored.
+    :param --no-cache: Analyze every file again instead of reusing the
+        results cached for unchanged files.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -j, --jobs <int>: Number of worker processes used to analyze the
+        files (default: number of CPUs).
+    :param -f, --fmt <str>: set output table format; supported formats:
+      plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param --max-file-size <int>: Skip the files larger than this many
+        kilobytes.
+    :param --file-timeout <float>: Stop analyzing a file after this many
+        seconds of cpu time and skip it.
+    :param --slowest <int>: Show the N files that took the most cpu time to
+        analyze.
+    '''
+    budget = _file_budget(max_file_size, file_timeout, slowest)
+    with _files_metrics(
+            paths, ignore, no_cache, cache_dir, jobs, budget) as metrics:
+        data = sorted(metrics)
+    header = ['File', 'Complexity score', 'Maintainability score',
+              'Physical lines of code']
+    rows = (
+        [_file, scores.complexity, scores.maintainability, scores.loc]
+        for _file, scores in data)
+
+    write_table(rows, header, table_format=fmt)
+
+
+@command
+def metrics_diff(from_commit, to_commit, path='.', ignore=None,
+                 no_cache=False, cache_dir=None, fmt=u'csv'):
+    '''Shows complexity, maintainability and line count before and after
+    a range of commits, for the python files changed in that range.
+
+    Files are read from the git object database, so nothing is checked out
+    and only the changed files are analyzed.
+    The default output is in CSV format.
+
+    :param from_commit: The start commit point.
+    :param to_commit: The end commit point.
+    :param path: The path for the working tree directory of the git repo.
+    :param ignore: regex pattern to match the files to exclude from output.
+    :param --no-cache: Analyze every file again instead of reusing the
+        results cached for unchanged files.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -f, --fmt <str>: set output table format; supported formats:
+      plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    '''
+    from code_metrics import radon_metrics
+    from code_metrics import diff_metrics
+    with _open_cache('radon', no_cache, cache_dir) as radon_cache:
+        data = diff_metrics.get_metrics_diff(
+            path, from_commit, to_commit, ignore, radon_cache) or {}
+
+    header = ['File',
+              'Complexity before', 'Complexity after',
+              'Maintainability before', 'Maintainability after',
+              'Lines before', 'Lines after']
+    rows = []
+    for _file, (before, after) in data.items():
+        row = [_file]
+        for field in radon_metrics.FileMetrics._fields:
+            row.append(getattr(before, field) if before else None)
+            row.append(getattr(after, field) if after else None)
+        rows.append(row)
+    write_table(rows, header, table_format=fmt)
+
+
+@command
+def gate(base, head='HEAD', path='.', ignore=None, max_complexity=None,
+         min_maintainability=None, max_line_count=None, fail_fast=False,
+         no_cache=False, cache_dir=None, fmt=u'plain'):
+    '''Fails when a python file changed since BASE goes past a threshold.
+
+    Only the files changed in BASE..HEAD are analyzed, as they are at HEAD,
+    so the time it takes depends on the size of the change and not on the
+    size of the repo. Lists the violations and exits with status 1 if there
+    are any.
+
+    :param base: The revision the change is compared to, e.g. origin/master.
+    :param head: The revision holding the change.
+    :param path: The path for the working tree directory of the git repo.
+    :param ignore: regex pattern to match the files to exclude from output.
+    :param --max-complexity <float>: Highest average complexity allowed.
+    :param --min-maintainability <float>: Lowest maintainability allowed.
+    :param --max-line-count <int>: Highest line count allowed.
+    :param --fail-fast: Stop at the first violation.
+    :param --no-cache: Analyze every file again instead of reusing the
+        results cached for unchanged files.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -f, --fmt <str>: set output table format; supported formats:
+      plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
+      latex, latex_booktabs, tsv, csv, jsonl (default: plain)
+    '''
+    from code_metrics import gate_metrics
+    limits = {
+        'complexity': max_complexity,
+        'maintainability': min_maintainability,
+        'loc': max_line_count,
+    }
+    if all(limit is None for limit in limits.values()):
+        sys.stderr.write("gate: no threshold given\n")
+        return 2
+    with _open_cache('radon', no_cache, cache_dir) as radon_cache:
+        violations = gate_metrics.iter_violations(
+            path, base, head, limits, ignore, radon_cache)
+        if fail_fast:
+            violations = itertools.islice(violations, 1)
+        violations = list(violations)
+
+    write_table(violations, ['File', 'Metric', 'Value', 'Limit'],
+                table_format=fmt)
+    if violations:
+        return 1
+    return None
+
+
+@command
+def metrics_trend(path='.', last=None, ignore=None, no_cache=False,
+                  cache_dir=None, fmt=u'csv'):
+    '''Shows average complexity, maintainability and line count per release.
+
+    Releases are the tags ordered as version numbers, oldest first.
+    Files are read from the git object database and each distinct file
+    content is analyzed only once across all releases.
+    The default output is in CSV format.
+
+    :param path: The path for the working tree directory of the git repo.
+    :param -n, --last <int>: Show only the most recent N releases.
+    :param ignore: regex pattern to match the files to exclude from output.
+    :param --no-cache: Analyze every file again instead of reusing the
+        results cached for unchanged files.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -f, --fmt <str>: set output table format; supported formats:
+      plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    '''
+    from code_metrics import trend_metrics
+    with _open_cache('radon', no_cache, cache_dir) as radon_cache:
+        trend = trend_metrics.get_metrics_trend(
+            path, last, ignore, radon_cache) or {}
+
+    header = ['Release', 'Files', 'Average complexity',
+              'Average maintainability', 'Average line count']
+    rows = ([tag] + list(averages) for tag, averages in trend.items())
+    write_table(rows, header, table_format=fmt)
+
+
+@command
+@arg('paths', nargs='+')
+def pylint_score(paths, rcfile=None, jobs=None, per_package=False,
+                 fmt=u'csv', ignore=None, max_file_size=None,
+                 file_timeout=None, slowest=None, no_cache=False,
+                 cache_dir=None):
     '''Shows pylint score.
 
+    Every package is linted in its own worker process and the global
+    score is computed from the merged message counts. The counts of each
+    module are cached, so only the modules changed since, or importing a
+    changed module, are linted again.
+
     :param paths: paths that pylint will check
     :param --rcfile <str>: Path to pylint rc file
+    :param -j, --jobs <int>: Number of worker processes used to lint the
+        packages (default: number of CPUs).
+    :param -p, --per-package: Show a table with the score of each package
+        instead of the global score.
+    :param -f, --fmt <str>: set output table format for --per-package;
+      supported formats: plain, simple, grid, fancy_grid, pipe, orgtbl, rst,
+      mediawiki, html, latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param -i, --ignore <str>: Ignore directories when their name matches one
+        of these glob patterns, as for the radon commands. Files ignored by
+        git or by the ignore settings of the pylint configuration, and
+        virtualenvs, are never linted.
+    :param --max-file-size <int>: Skip the files larger than this many
+        kilobytes.
+    :param --file-timeout <float>: Stop linting a file after this many
+        seconds of cpu time and skip it.
+    :param --slowest <int>: Show the N files that took the most cpu time to
+        lint.
+    :param --no-cache: Lint every module again instead of reusing the counts
+        cached for unchanged modules.
+    :param --cache-dir <str>: Directory holding the results cache (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
     '''
-    score = pylint_metrics.get_global_score(paths, rcfile)
-    sys.stdout.write(str(score))
+    from code_metrics import pylint_metrics
+    budget = _file_budget(max_file_size, file_timeout, slowest)
+    with _open_cache('pylint', no_cache, cache_dir) as pylint_cache:
+        packages_stats = pylint_metrics.get_packages_stats(
+            paths, rcfile, jobs or utils.cpu_count(), ignore, budget,
+            pylint_cache)
+    _write_budget_report(budget)
+    if not per_package:
+        score = pylint_metrics.get_global_score(
+            paths, rcfile, packages_stats=packages_stats)
+        sys.stdout.write(str(score))
+        return
+
+    header = ['Package', 'Statements', 'Errors', 'Warnings', 'Refactors',
+              'Conventions', 'Score']
+    rows = [
+        [package, stats['statement'], stats['error'], stats['warning'],
+         stats['refactor'], stats['convention'],
+         pylint_metrics.rounded_score(stats)]
+        for package, stats in packages_stats.items()]
+    write_table(rows, header, table_format=fmt)
 
 
 @command
@@ -171,6 +636,7 @@ def recent_tags(path='.'):
 
     :param path: The path for the working tree directory of the git repo.
     '''
+    from code_metrics import git_utils
     tags = git_utils.get_most_recent_tag_names(git_utils.get_repo(path))
     sys.stdout.write(" ".join(tags))
 
@@ -179,23 +645,32 @@ def recent_tags(path='.'):
 def jira_tickets(from_commit, to_commit, path='.'):
     '''Shows all JIRA tickets between two commits.
 
+    The ticket of every commit is kept in an index in the .git directory,
+    extended with the new commits on every call. JIRA_PROJECT_ID can list
+    several projects separated by commas.
+
     :param path: The path for the working tree directory of the git repo.
     :param from_commit: The start commit point.
     :param to_commit: The end commit point.
     '''
+    from code_metrics import bug_metrics
     ticket_commits = bug_metrics.get_ticket_commits(path, from_commit, to_commit) or {}
     tickets = set(ticket_commits.values())
     sys.stdout.write(" ".join(tickets))
 
 
 @command
-def bug_score(from_commit, to_commit, path='.', ignore=None, fmt=u'csv'):
+def bug_score(from_commit, to_commit, path='.', ignore=None, fmt=u'csv',
+              offline=False, no_cache=False, cache_dir=None, cache_ttl=None):
     '''Shows a list of changed files by bug tickets between two commits.
 
     The output is in csv format. It contains 4 columns:
     'No of tickets', 'Tickets', 'Score', 'File changed'.
     The score column shows the sum of the change score
     that file suffered for each bug(commit) that touched it.
+    The tickets of the commits are read from the same index as jira_tickets
+    and looked up in JIRA while git diffs the commits of every ticket; the
+    commits of the tickets that are not bugs are dropped once JIRA answered.
 
     :param from_commit: The start commit point.
     :param to_commit: The end commit point.
@@ -203,16 +678,304 @@ def bug_score(from_commit, to_commit, path='.', ignore=None, fmt=u'csv'):
     :param ignore: regex pattern to match the files to exclude from output.
     :param -f, --fmt <str>: set output table format; supported formats:
       plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
-      latex, latex_booktabs, tsv, csv (default: csv)
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param --offline: Do not query JIRA, use only the cached issue types.
+    :param --no-cache: Query JIRA for every ticket instead of reusing the
+        cached issue types.
+    :param --cache-dir <str>: Directory holding the issue types cache
+        (default: $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param --cache-ttl <int>: Hours a cached issue type stays valid
+        (default: 168).
     '''
-    score_data = bug_metrics.get_bug_score(path, from_commit, to_commit, ignore) or {}
+    from code_metrics import bug_metrics
+    with _jira_client(no_cache, cache_dir, cache_ttl, offline) as jira_client:
+        score_data = bug_metrics.get_bug_score(
+            path, from_commit, to_commit, ignore, jira_client) or {}
 
     header = ['No of tickets', 'Tickets', 'Score', 'File changed']
     rows = [
         [len(stats['tickets']), ' '.join(stats['tickets']), stats['changes_score'], _file,]
         for _file, stats in score_data.items()]
-    sys.stdout.write(as_table(rows, header, table_format=fmt))
+    write_table(rows, header, table_format=fmt)
+
+
+@command
+def hotspots(from_commit, to_commit, path='.', ignore=None, limit=None,
+             fmt=u'csv', offline=False, no_cache=False, cache_dir=None,
+             cache_ttl=None):
+    '''Shows the files changed by bug tickets ranked by risk.
+
+    Combines bug_score with the radon metrics of the changed python files,
+    as they are at TO_COMMIT. The risk is the change score of the file
+    multiplied by its average complexity, files without functions count as
+    complexity 1. Riskiest files first.
+
+    :param from_commit: The start commit point.
+    :param to_commit: The end commit point.
+    :param path: The path for the working tree directory of the git repo.
+    :param ignore: regex pattern to match the files to exclude from output.
+    :param -l, --limit <int>: max no of rows to display
+    :param -f, --fmt <str>: set output table format; supported formats:
+      plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param --offline: Do not query JIRA, use only the cached issue types.
+    :param --no-cache: Query JIRA and analyze every file again instead of
+        reusing the cached issue types and metrics.
+    :param --cache-dir <str>: Directory holding the caches (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param --cache-ttl <int>: Hours a cached issue type stays valid
+        (default: 168).
+    '''
+    from code_metrics import hotspot_metrics
+    with _jira_client(no_cache, cache_dir, cache_ttl, offline) as jira_client, \
+            _open_cache('radon', no_cache, cache_dir) as radon_cache:
+        data = hotspot_metrics.get_hotspots(
+            path, from_commit, to_commit, ignore, jira_client, radon_cache,
+            limit)
+
+    header = ['Risk', 'Score', 'No of tickets', 'Complexity score',
+              'Maintainability score', 'Tickets', 'File changed']
+    rows = (
+        [hotspot.risk, hotspot.changes_score, hotspot.ticket_count,
+         hotspot.complexity, hotspot.maintainability,
+         ' '.join(hotspot.tickets), hotspot.file_path]
+        for hotspot in data
+    )
+    write_table(rows, header, table_format=fmt)
+
+
+@command
+@arg('paths', nargs='+')
+def serve(paths, ignore=None, socket=None, interval=1.0, jobs=None,
+          cache_dir=None):
+    '''Keeps the metrics of a tree in memory and answers queries about them.
+
+    Every file is analyzed once, then the files whose modification time
+    or size changed are analyzed again every INTERVAL seconds. The commands
+    analyzing the same paths, with the same --ignore and from the same
+    directory, get their metrics from the daemon instead of analyzing the
+    files again, unless --no-cache is given; the daemon scans the tree for
+    changes before answering them.
+    Other clients send one JSON request per line on the Unix socket, like
+    {"query": "top", "field": "complexity", "limit": 10},
+    {"query": "file", "filename": "src/module.py"} or
+    {"query": "summary", "field": "loc"}, and get back {"result": ...}.
+    {"query": "files"} is answered with one {"item": [filename, metrics]}
+    line per file followed by {"end": true}.
+    Queries are answered from the last scan, except that a file query checks
+    that file first; add "refresh": true to scan the whole tree first.
+    The daemon stops on SIGINT or SIGTERM.
+
+    :param paths: The paths where to find modules or packages to analyze. More
+        than one path is allowed.
+    :param -i, --ignore <str>: Ignore directories when their name matches one
+        of these glob patterns: radon won't even descend into them. By default,
+        hidden directories (starting with '.') are ignored.
+    :param --socket <str>: Path of the Unix socket to listen on (default: a
+        socket named after the served tree in the cache directory).
+    :param --interval <float>: Seconds between two scans for changed files.
+    :param -j, --jobs <int>: Number of worker processes used to analyze the
+        files (default: number of CPUs).
+    :param --cache-dir <str>: Directory holding the default socket (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    '''
+    from code_metrics import daemon
+    daemon.serve(paths, ignore, socket, interval, jobs or utils.cpu_count(),
+                 cache_dir)
+
+
+def _run_captured(report, args):
+    # runs a command and returns what it printed and its exit status
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        status = report(*args)
+        return sys.stdout.getvalue(), status
+    finally:
+        sys.stdout = stdout
+
+
+def _render_report(command_line):
+    from xml.sax.saxutils import escape
+    report, args = parse(shlex.split(command_line))
+    arg_names = report.__code__.co_varnames[:report.__code__.co_argcount]
+    if 'fmt' in arg_names and args[arg_names.index('fmt')] == u'csv':
+        # render tables in confluence's (xhtml) storage format
+        args[arg_names.index('fmt')] = u'html'
+
+    output, _ = _run_captured(report, args)
+    if output.lstrip().startswith('<'):
+        return output
+    return u'<pre>{}</pre>'.format(escape(output))
+
+
+@command
+@arg('reports', nargs='+')
+def publish(reports, parent=None, no_cache=False, cache_dir=None, fmt=u'csv'):
+    '''Publishes metrics reports as pages of a Confluence space.
+
+    Every report is given as "TITLE=COMMAND [ARGS...]", for example
+    "Complexity=files_complexity src --limit 50". The command runs as if
+    called from the command line and its table is rendered as HTML.
+    Pages that do not exist are created, pages whose content did not
+    change since the last publish are left untouched.
+    The Confluence space is configured with the CONFLUENCE_URL,
+    CONFLUENCE_USER, CONFLUENCE_PASSWORD and CONFLUENCE_SPACE env vars.
+
+    :param reports: The reports to publish, as TITLE=COMMAND.
+    :param --parent <str>: Title of the page new pages are created under.
+    :param --no-cache: Update every page, even when its content did not
+        change since the last publish.
+    :param --cache-dir <str>: Directory holding the published pages cache
+        (default: $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    :param -f, --fmt <str>: set output table format; supported formats:
+      plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    '''
+    from code_metrics.confluence_utils import ConfluenceSpace
+    pages = []
+    for report in reports:
+        title, _, command_line = report.partition('=')
+        pages.append((title.strip(), _render_report(command_line)))
+
+    space = ConfluenceSpace.from_environment()
+    with _open_cache('confluence', no_cache, cache_dir) as pages_cache:
+        published = space.publish_pages(pages, parent, pages_cache)
+    write_table(published, ['Title', 'Page id', 'Status'], table_format=fmt)
+
+
+# file extensions of the per repo outputs written by batch
+FORMAT_EXTENSIONS = {u'csv': 'csv', u'tsv': 'tsv', u'jsonl': 'jsonl',
+                     u'html': 'html'}
+
+
+def _read_manifest(manifest):
+    # one "REPO COMMAND [ARGS]" per line, blank lines and comments skipped
+    tasks = []
+    with open(manifest) as lines:
+        for line in lines:
+            words = shlex.split(line, comments=True)
+            if words:
+                tasks.append((words[0], words[1:]))
+    return tasks
+
+
+def _output_path(output_dir, repo, command_name, fmt, used):
+    # repos and commands appearing more than once get numbered outputs
+    repo_dir = os.path.basename(os.path.abspath(repo)) or 'repo'
+    name = '{}.{}'.format(command_name, FORMAT_EXTENSIONS.get(fmt, 'txt'))
+    path = os.path.join(output_dir, repo_dir, name)
+    number = 1
+    while path in used:
+        number += 1
+        path = os.path.join(output_dir, repo_dir, '{}-{}.{}'.format(
+            command_name, number, FORMAT_EXTENSIONS.get(fmt, 'txt')))
+    used.add(path)
+    return path
+
+
+def _run_in_repo(repo, args):
+    report, report_args = parse(args)
+    arg_names = report.__code__.co_varnames[:report.__code__.co_argcount]
+    fmt = report_args[arg_names.index('fmt')] if 'fmt' in arg_names else None
+    cwd = os.getcwd()
+    os.chdir(repo)
+    try:
+        return (report.__name__, fmt) + _run_captured(report, report_args)
+    finally:
+        os.chdir(cwd)
+
+
+@command
+def batch(manifest, output_dir='reports', jobs=None, fmt=u'csv',
+          cache_dir=None):
+    '''Runs commands over many repositories in a single process.
+
+    The manifest lists one repository and command per line, e.g.
+    "/srv/repos/api files_complexity src --limit 20" or
+    "/srv/repos/api bug_score 1.0.0 master --offline". Lines starting with #
+    are comments. Each command runs from its repository directory and its
+    output is written under OUTPUT_DIR/REPO/COMMAND.EXT. All commands share
+    one pool of worker processes, one JIRA connection and the caches; a
+    failing command, or one exiting with a non-zero status, is reported
+    and the next ones still run.
+    Prints a table with the status of every command and exits with 1 when
+    any of them failed.
+
+    :param manifest: File listing the repositories and commands to run.
+    :param -o, --output-dir <str>: Directory the outputs are written to.
+    :param -j, --jobs <int>: Number of worker processes shared by the
+        commands (default: number of CPUs).
+    :param -f, --fmt <str>: set output table format; supported formats:
+      plain, simple, grid, fancy_grid, pipe, orgtbl, rst, mediawiki, html,
+      latex, latex_booktabs, tsv, csv, jsonl (default: csv)
+    :param --cache-dir <str>: Directory holding the caches (default:
+        $CODE_METRICS_CACHE_DIR or ~/.cache/code_metrics).
+    '''
+    tasks = _read_manifest(manifest)
+    rows = []
+    used = set()
+    _shared.update(caches={}, cache_dir=cache_dir)
+    try:
+        with utils.shared_pool(jobs or utils.cpu_count()):
+            for index, (repo, args) in enumerate(tasks, 1):
+                start = time.time()
+                try:
+                    command_name, task_fmt, output, exit_status = _run_in_repo(
+                        repo, args)
+                    path = _output_path(
+                        output_dir, repo, command_name, task_fmt, used)
+                    if not os.path.isdir(os.path.dirname(path)):
+                        os.makedirs(os.path.dirname(path))
+                    with open(path, 'w') as output_file:
+                        output_file.write(output)
+                    status, detail = 'ok', path
+                    if exit_status:
+                        # e.g. a gate finding violations, its output is kept
+                        status = 'failed'
+                        detail = 'exit status {}: {}'.format(exit_status, path)
+                except SystemExit:
+                    # mando already printed the usage of the command
+                    status, detail = 'failed', 'invalid arguments'
+                except Exception as error: # pylint: disable=broad-except
+                    status = 'failed'
+                    detail = '{}: {}'.format(type(error).__name__, error)
+                seconds = time.time() - start
+                sys.stderr.write("[{}/{}] {} {}: {} in {:.1f}s\n".format(
+                    index, len(tasks), repo, ' '.join(args[:1]), status,
+                    seconds))
+                rows.append([repo, ' '.join(args), status, round(seconds, 3),
+                             detail])
+    finally:
+        caches = _shared.get('caches', {})
+        _shared.clear()
+        for cache in caches.values():
+            cache.close()
+            sys.stderr.write('{}\n'.format(cache))
+
+    write_table(rows, ['Repo', 'Command', 'Status', 'Seconds', 'Output'],
+                table_format=fmt)
+    if any(row[2] != 'ok' for row in rows):
+        return 1
+    return None
+
+
+def main(argv=None):
+    command_func, args = parse(sys.argv[1:] if argv is None else argv)
+    # read before running, reports rendered by publish parse again
+    profile, cprofile_path = program.profile, program.cprofile
+    profile_path = program.profile_output
+    if not profile and not cprofile_path:
+        return command_func(*args)
+    profiling.enable()
+    try:
+        if cprofile_path:
+            return profiling.run_profiled(command_func, args, cprofile_path)
+        return command_func(*args)
+    finally:
+        if profile:
+            profiling.write_summary(profile_path, command_func.__name__)
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -1,5 +1,29 @@
+import hashlib
 import os
+import time
+from multiprocessing.pool import ThreadPool
+
 import requests
+from code_metrics import profiling
+from code_metrics import utils
+
+# server errors are retried with an exponential backoff
+RETRIES = 4
+BACKOFF_SECONDS = 0.5
+# titles looked up by a single CQL search
+TITLES_PER_SEARCH = 50
+# pages published at the same time over the pooled session
+PUBLISH_THREADS = 4
+
+
+def content_hash(content):
+    if not isinstance(content, bytes):
+        content = content.encode('utf-8')
+    return hashlib.sha1(content).hexdigest()
+
+
+def _cql_string(value):
+    return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
 
 
 class ConfluenceSpace(object):
@@ -9,6 +33,11 @@ class ConfluenceSpace(object):
         self.space_key = space_key
         self.session = requests.Session()
         self.session.auth = (username, password)
+        # title -> page id and page id -> title and version, filled as
+        # pages are looked up so later calls skip the extra GET
+        self._page_ids = {}
+        self._pages = {}
+        self._missing_titles = set()
 
     @classmethod
     def from_environment(cls):
@@ -30,17 +59,64 @@ class ConfluenceSpace(object):
     def __str__(self):
         return "{} - {}".format(self.url, self.space_key)
 
+    def _request(self, method, url, **kwargs):
+        for attempt in range(RETRIES):
+            with profiling.span('confluence.request'):
+                response = self.session.request(method, url, **kwargs)
+            profiling.count('http_requests')
+            if response.status_code < 500:
+                return response
+            if attempt < RETRIES - 1:
+                time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+        # the server still fails after the last retry
+        response.raise_for_status()
+        return response
+
+    def _remember_page(self, page_data):
+        self._missing_titles.discard(page_data['title'])
+        self._page_ids[page_data['title']] = page_data['id']
+        self._pages[page_data['id']] = {
+            'title': page_data['title'],
+            'version': page_data['version']['number'],
+        }
+
     def get_page_id(self, title):
-        response = self.session.get(self.url, params={
-            'spaceKey': self.space_key, 'title': title
+        if title in self._page_ids or title in self._missing_titles:
+            return self._page_ids.get(title)
+        response = self._request('get', self.url, params={
+            'spaceKey': self.space_key, 'title': title, 'expand': 'version'
         })
         results = response.json().get('results', None)
         if not results:
             return None
         assert len(results) == 1, "multiple pages found for title {}".format(title)
+        self._remember_page(results[0])
         return results[0]['id']
 
-    def create_page(self, title, parent_id=None):
+    def get_page_ids(self, titles):
+        missing = sorted(set(titles) - set(self._page_ids))
+        for batch in utils.chunks(missing, TITLES_PER_SEARCH):
+            cql = "space = {} AND type = page AND title in ({})".format(
+                _cql_string(self.space_key),
+                ", ".join(_cql_string(title) for title in batch))
+            response = self._request('get', "{}/search".format(self.url), params={
+                'cql': cql, 'expand': 'version', 'limit': len(batch)
+            })
+            for page_data in response.json().get('results', []):
+                self._remember_page(page_data)
+        self._missing_titles.update(set(missing) - set(self._page_ids))
+        return dict(
+            (title, self._page_ids[title])
+            for title in titles if title in self._page_ids
+        )
+
+    def get_page(self, page_id):
+        page_url = "{}/{}".format(self.url, page_id)
+        response = self._request('get', page_url, params={'expand': 'version'})
+        self._remember_page(response.json())
+        return self._pages[page_id]
+
+    def create_page(self, title, parent_id=None, content=None):
         data = {
             'title': title,
             'type': 'page',
@@ -48,34 +124,99 @@ class ConfluenceSpace(object):
         }
         if parent_id:
             data['ancestors'] = [{"id": parent_id}]
-        response = self.session.post(self.url, json=data)
-        return response.json()['id']
+        if content is not None:
+            data['body'] = {
+                'storage': {
+                    'value': content,
+                    'representation': 'storage',
+                }
+            }
+        response = self._request('post', self.url, json=data)
+        page_data = response.json()
+        if 'version' in page_data:
+            self._remember_page(page_data)
+        return page_data['id']
 
     def get_page_content(self, page_id):
         page_url = "{}/{}".format(self.url, page_id)
-        response = self.session.get(page_url, params={'expand': 'body.storage'})
+        response = self._request('get', page_url, params={'expand': 'body.storage'})
         return response.json()['body']['storage']['value']
 
     def set_page_content(self, page_id, content):
         page_url = "{}/{}".format(self.url, page_id)
-        response = self.session.get(page_url, params={'expand': 'version'})
-        page_data = response.json()
-        page_version = page_data['version']['number']
-        title = page_data['title']
-        response = self.session.put(page_url, json={
-            'type': 'page',
-            'title': title,
-            'body': {
-                'storage': {
-                    'value': content,
-                    'representation': 'storage',
+        page_data = self._pages.get(page_id) or self.get_page(page_id)
+        for attempt in range(RETRIES):
+            response = self._request('put', page_url, json={
+                'type': 'page',
+                'title': page_data['title'],
+                'body': {
+                    'storage': {
+                        'value': content,
+                        'representation': 'storage',
+                    }
+                },
+                'version': {
+                    'number': page_data['version'] + 1,
                 }
-            },
-            'version': {
-                'number': page_version + 1,
-            }
-        })
+            })
+            if response.status_code != requests.codes.CONFLICT: # pylint: disable=no-member
+                break
+            # the page was edited meanwhile, retry on top of its new version
+            time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+            page_data = self.get_page(page_id)
         assert response.status_code == requests.codes.OK, ( # pylint: disable=no-member
             "Cannot update page content: {}".format(response.reason)
         )
+        self._remember_page(response.json())
         return response.json()
+
+    def publish_page(self, title, content, parent_id=None, cache=None):
+        # returns the page id and whether it was created, updated or unchanged
+        digest = content_hash(content)
+        page_id = self.get_page_id(title)
+        if not page_id:
+            page_id = self.create_page(title, parent_id, content)
+            status = 'created'
+        else:
+            page_data = self._pages.get(page_id) or self.get_page(page_id)
+            published = self._get_published(page_id, cache)
+            if published == [page_data['version'], digest]:
+                return page_id, 'unchanged'
+            self.set_page_content(page_id, content)
+            status = 'updated'
+        if cache is not None and page_id in self._pages:
+            cache.set(self._published_key(page_id),
+                      [self._pages[page_id]['version'], digest])
+        return page_id, status
+
+    def _published_key(self, page_id):
+        return "{}/{}".format(self.url, page_id)
+
+    def _get_published(self, page_id, cache):
+        # version and content hash of the last content this tool published
+        if cache is None:
+            return None
+        return cache.get(self._published_key(page_id))
+
+    def publish_pages(self, pages, parent_title=None, cache=None):
+        # pages is a list of (title, content) pairs; the titles are looked up
+        # in batches first, then independent pages are published concurrently
+        titles = [title for title, _ in pages]
+        self.get_page_ids(titles + ([parent_title] if parent_title else []))
+        parent_id = self.get_page_id(parent_title) if parent_title else None
+        assert not parent_title or parent_id, (
+            "parent page not found: {}".format(parent_title)
+        )
+
+        def publish(page):
+            return self.publish_page(page[0], page[1], parent_id, cache)
+
+        pool = ThreadPool(max(1, min(PUBLISH_THREADS, len(pages))))
+        try:
+            results = pool.map(publish, pages)
+        finally:
+            pool.terminate()
+        return [
+            (title, page_id, status)
+            for title, (page_id, status) in zip(titles, results)
+        ]
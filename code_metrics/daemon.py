@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import types
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from code_metrics import radon_metrics
+from code_metrics.cache import default_cache_dir
+from code_metrics.discovery import find_python_files
+from code_metrics.utils import parallel_map
+
+# seconds between two scans of the served tree
+POLL_INTERVAL = 1.0
+# seconds a client waits for an answer before analyzing the files itself
+CLIENT_TIMEOUT = 30.0
+
+
+def socket_path(paths, ignore=None, cache_dir=None):
+    # one daemon per tree: the filenames it reports are relative to the
+    # directory it was started from, as for the commands themselves
+    key = json.dumps([os.getcwd(), list(paths), ignore])
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(
+        cache_dir or default_cache_dir(), 'serve-{}.sock'.format(digest))
+
+
+class MetricsIndex(object):
+    # file and function metrics of a tree, kept up to date by comparing
+    # the files mtime and size with the ones they had when analyzed
+
+    def __init__(self, paths, ignore=None, jobs=1):
+        self.paths = paths
+        self.ignore = ignore
+        self.jobs = jobs
+        self.filenames = []
+        # filename -> (mtime, size, FileMetrics, blocks)
+        self.entries = {}
+        # guards the entries; the scans run outside of it, one at a time,
+        # so queries never wait for the tree to be walked or analyzed
+        self.lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self):
+        # returns the number of files analyzed again or removed
+        with self._refresh_lock:
+            filenames = find_python_files(self.paths, self.ignore, refresh=True)
+            stamps = {}
+            for filename in filenames:
+                stamp = _stamp(filename)
+                if stamp is not None:
+                    stamps[filename] = stamp
+            with self.lock:
+                changed = [
+                    filename for filename, stamp in stamps.items()
+                    if self.entries.get(filename, (None, None))[:2] != stamp
+                ]
+                removed = set(self.entries) - set(stamps)
+            results = parallel_map(
+                radon_metrics.analyze_file_blocks, changed, self.jobs)
+            with self.lock:
+                for filename in removed:
+                    del self.entries[filename]
+                for filename, (metrics, blocks) in zip(changed, results):
+                    self.entries[filename] = stamps[filename] + (metrics, blocks)
+                self.filenames = [
+                    filename for filename in filenames if filename in stamps
+                ]
+            return len(changed) + len(removed)
+
+    def refresh_file(self, filename):
+        # a single stat, so a file saved since the last scan is not
+        # answered with its old metrics
+        with self.lock:
+            entry = self.entries.get(filename)
+        if entry is None:
+            return
+        stamp = _stamp(filename)
+        if stamp is None or stamp == entry[:2]:
+            return
+        metrics, blocks = radon_metrics.analyze_file_blocks(filename)
+        with self.lock:
+            self.entries[filename] = stamp + (metrics, blocks)
+
+    def iter_files_metrics(self):
+        with self.lock:
+            for filename in self.filenames:
+                metrics = self.entries[filename][2]
+                if metrics is not None:
+                    yield filename, metrics
+
+    def files(self):
+        # streamed to the client one file at a time, without holding the
+        # lock while it reads them
+        with self.lock:
+            filenames = self.filenames
+        for filename in filenames:
+            with self.lock:
+                entry = self.entries.get(filename)
+            if entry is not None and entry[2] is not None:
+                yield [filename, list(entry[2])]
+
+    def top(self, field, limit=None, reverse=True):
+        # reverse=False puts the lowest scores first, as for maintainability
+        data = radon_metrics.sorted_view(
+            list(self.iter_files_metrics()), field, reverse, limit)
+        return list(data.items())
+
+    def file(self, filename):
+        with self.lock:
+            entry = self.entries.get(filename)
+        if entry is None or entry[2] is None:
+            return None
+        return {
+            'metrics': entry[2]._asdict(),
+            'functions': [
+                {'name': name, 'line': line, 'complexity': complexity}
+                for name, line, complexity in entry[3]
+            ],
+        }
+
+    def summary(self, field):
+        stats = radon_metrics.aggregate_files_metric(
+            self.paths, self.ignore, field, list(self.iter_files_metrics()))
+        return stats.summary()
+
+    def answer(self, request):
+        # answers from the last scan unless asked to scan the tree first,
+        # which takes as long as walking and stating every file
+        query = request.get('query')
+        if request.get('refresh', False):
+            self.refresh()
+        if query == 'files':
+            return self.files()
+        if query == 'top':
+            return self.top(request['field'], request.get('limit'),
+                            request.get('reverse', True))
+        if query == 'file':
+            self.refresh_file(request['filename'])
+            return self.file(request['filename'])
+        if query == 'summary':
+            return self.summary(request['field'])
+        raise ValueError("unknown query: {}".format(query))
+
+
+def _stamp(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in iter(self.rfile.readline, b''):
+            try:
+                result = self.server.index.answer(json.loads(
+                    line.decode('utf-8')))
+                if isinstance(result, types.GeneratorType):
+                    # one line per item, then the end of the answer
+                    for item in result:
+                        self._write({'item': item})
+                    response = {'end': True}
+                else:
+                    response = {'result': result}
+            except Exception as error: # pylint: disable=broad-except
+                response = {'error': "{}: {}".format(
+                    type(error).__name__, error)}
+            self._write(response)
+
+    def _write(self, response):
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+
+class MetricsServer(socketserver.ThreadingUnixStreamServer):
+    # answers one json request per line with one json response per line,
+    # preceded by one line per item for the streamed answers
+
+    daemon_threads = True
+
+    def __init__(self, path, index):
+        self.index = index
+        socketserver.ThreadingUnixStreamServer.__init__(
+            self, path, _RequestHandler)
+
+
+def _poll(index, interval, stopped):
+    while not stopped.wait(interval):
+        index.refresh()
+
+
+def serve(paths, ignore=None, path=None, interval=POLL_INTERVAL, jobs=1,
+          cache_dir=None):
+    path = path or socket_path(paths, ignore, cache_dir)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    if os.path.exists(path):
+        # a socket left behind by a daemon that did not exit cleanly
+        client = DaemonClient.connect(path)
+        if client is not None:
+            client.close()
+            raise RuntimeError("a daemon already serves {}".format(path))
+        os.remove(path)
+
+    index = MetricsIndex(paths, ignore, jobs)
+    index.refresh()
+    server = MetricsServer(path, index)
+    stopped = threading.Event()
+    poller = threading.Thread(target=_poll, args=(index, interval, stopped))
+    poller.daemon = True
+    poller.start()
+    # stop cleanly, removing the socket, when killed
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    sys.stderr.write("serving {} files on {}\n".format(
+        len(index.filenames), path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class DaemonClient(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+
+    @classmethod
+    def connect(cls, path, timeout=CLIENT_TIMEOUT):
+        # returns None when no daemon listens on path
+        if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(path)
+        except (OSError, socket.error):
+            sock.close()
+            return None
+        return cls(sock)
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def query(self, query, **params):
+        # a streamed answer is returned as the list of its items
+        items = []
+        for response in self._responses(query, params):
+            if 'item' in response:
+                items.append(response['item'])
+            elif 'end' in response:
+                return items
+            else:
+                return response['result']
+
+    def stream(self, query, **params):
+        # yields the items of a streamed answer as they are read
+        for response in self._responses(query, params):
+            if 'item' not in response:
+                return
+            yield response['item']
+
+    def _responses(self, query, params):
+        params['query'] = query
+        self.sock.sendall(json.dumps(params).encode('utf-8') + b'\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                raise RuntimeError("the daemon closed the connection")
+            response = json.loads(line.decode('utf-8'))
+            if 'error' in response:
+                raise RuntimeError(response['error'])
+            yield response
+            if 'item' not in response:
+                return
+
+    def iter_files_metrics(self):
+        # the commands need every file as it is now, not as last scanned
+        for filename, metrics in self.stream('files', refresh=True):
+            yield filename, radon_metrics.FileMetrics(*metrics)
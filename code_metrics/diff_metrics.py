@@ -0,0 +1,37 @@
+import re
+from collections import OrderedDict
+from code_metrics.radon_metrics import analyze_source_cached
+from code_metrics.git_utils import (
+    get_repo, get_changed_files, get_file_source)
+
+PYTHON_FILES = r".*\.py$"
+
+
+def get_source_metrics(git_commit, file_path, cache=None):
+    try:
+        source = get_file_source(git_commit, file_path)
+        if source is None:
+            return None
+        return analyze_source_cached(source, cache)
+    except Exception: # pylint: disable=broad-except
+        # files radon cannot decode or parse have no metrics
+        return None
+
+
+def get_metrics_diff(repo_path, from_commit, to_commit, ignore=None, cache=None):
+    repo = get_repo(repo_path)
+    before_commit = repo.commit(from_commit)
+    after_commit = repo.commit(to_commit)
+    changed_files = get_changed_files(
+        repo, from_commit, to_commit, match_only=PYTHON_FILES)
+
+    data = OrderedDict()
+    for file_path in sorted(changed_files):
+        if ignore and re.match(ignore, file_path):
+            continue
+        before = get_source_metrics(before_commit, file_path, cache)
+        after = get_source_metrics(after_commit, file_path, cache)
+        if before is None and after is None:
+            continue
+        data[file_path] = (before, after)
+    return data
@@ -0,0 +1,201 @@
+import fnmatch
+import os
+import re
+import subprocess
+from collections import namedtuple
+from functools import lru_cache
+
+from radon.cli.tools import _is_python_file
+from code_metrics import profiling
+
+# the files found for (directory, paths, ignore) during this run, so every
+# metric computed by the same process walks the tree only once
+_discovered = {}
+
+# a virtualenv is recognized by its config file, wherever it lives
+VIRTUALENV_MARKER = 'pyvenv.cfg'
+
+IgnoreRule = namedtuple(
+    'IgnoreRule', ['base', 'pattern', 'negate', 'dir_only', 'anchored'])
+
+
+def find_python_files(paths, ignore=None, refresh=False):
+    # the python files radon's iter_filenames(paths, ignore, ignore) would
+    # yield, minus the ones git ignores and the virtualenvs; directories in
+    # a git work tree are listed by git instead of being walked
+    key = (os.getcwd(), tuple(paths), ignore)
+    if refresh or key not in _discovered:
+        with profiling.span('discover'):
+            _discovered[key] = list(_iter_python_files(paths, ignore))
+        profiling.count('files_discovered', len(_discovered[key]))
+    return _discovered[key]
+
+
+def _iter_python_files(paths, ignore):
+    exclude = ignore.split(',') if ignore else []
+    ignore = ['.*'] + exclude
+    for path in paths:
+        if os.path.isfile(path):
+            if _is_python_file(path) and not _matches(path, exclude):
+                yield path
+            continue
+        names = _git_files(path)
+        if names is None:
+            names = _walk(path, ignore, [])
+        for name in _filter_names(names, ignore):
+            filename = os.path.normpath(os.path.join(path, name))
+            if _matches(filename, exclude) or not _is_python_name(filename):
+                continue
+            yield filename
+
+
+def _matches(name, patterns):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def _is_python_name(filename):
+    # only files without an extension are opened to look for a shebang
+    if os.path.splitext(os.path.basename(filename))[1] not in ('', '.py', '.ipynb'):
+        return False
+    return _is_python_file(filename)
+
+
+def _filter_names(names, ignore):
+    # names are relative to the listed directory and use '/'
+    names = list(names)
+    virtualenvs = set(
+        os.path.dirname(name) for name in names
+        if os.path.basename(name) == VIRTUALENV_MARKER
+    )
+    for name in names:
+        parts = name.split('/')
+        if parts[-1].startswith('.'):
+            continue
+        directories = parts[:-1]
+        if any(_matches(part, ignore) for part in directories):
+            continue
+        if virtualenvs and any(
+                '/'.join(directories[:depth]) in virtualenvs
+                for depth in range(len(directories) + 1)):
+            continue
+        yield name
+
+
+def _git_files(directory):
+    # tracked and untracked but not ignored files, None outside a work tree
+    # and for a directory git ignores: a path given explicitly is analyzed
+    # even if it is ignored, so it is walked instead
+    try:
+        with open(os.devnull, 'w') as devnull:
+            with profiling.span('git.ls_files'):
+                output = subprocess.check_output(
+                    ['git', '-C', directory, 'ls-files', '-z', '--cached',
+                     '--others', '--exclude-standard'], stderr=devnull)
+                ignored = subprocess.call(
+                    ['git', '-C', directory, 'check-ignore', '-q', '.'],
+                    stdout=devnull, stderr=devnull) == 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    if ignored:
+        return None
+    names = output.decode('utf-8', 'replace').split('\0')
+    # files deleted from the work tree are still in the index
+    return [
+        name for name in names
+        if name and os.path.isfile(os.path.join(directory, name))
+    ]
+
+
+def read_gitignore(directory, base=''):
+    rules = []
+    try:
+        with open(os.path.join(directory, '.gitignore')) as gitignore:
+            lines = gitignore.read().splitlines()
+    except (IOError, OSError):
+        return rules
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negate = line.startswith('!')
+        line = line.lstrip('!')
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if line.startswith('**/'):
+            line = line[3:]
+        anchored = '/' in line
+        rules.append(IgnoreRule(base, line.lstrip('/'), negate, dir_only, anchored))
+    return rules
+
+
+@lru_cache(maxsize=None)
+def _pattern_regex(pattern):
+    # git matches with FNM_PATHNAME: '*', '?' and classes do not match a
+    # '/', '**' between slashes matches any number of directories
+    parts = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith('**/', index):
+            parts.append('(?:.*/)?')
+            index += 3
+            continue
+        if pattern.startswith('**', index):
+            parts.append('.*')
+            index += 2
+            continue
+        if char == '*':
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', index + 2)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                chars = pattern[index + 1:end]
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                parts.append('(?!/)[{}]'.format(chars.replace('\\', '\\\\')))
+                index = end
+        elif char == '\\' and index + 1 < len(pattern):
+            index += 1
+            parts.append(re.escape(pattern[index]))
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return re.compile(''.join(parts) + r'\Z')
+
+
+def is_ignored(name, is_dir, rules):
+    # name is relative to the walked directory; the last matching rule wins
+    ignored = False
+    for rule in rules:
+        if rule.dir_only and not is_dir:
+            continue
+        if rule.base and not name.startswith(rule.base + '/'):
+            continue
+        relative = name[len(rule.base) + 1:] if rule.base else name
+        target = relative if rule.anchored else relative.rsplit('/', 1)[-1]
+        if _pattern_regex(rule.pattern).match(target):
+            ignored = not rule.negate
+    return ignored
+
+
+def _walk(directory, ignore, rules, base=''):
+    # os.scandir walk pruning the ignored directories and virtualenvs
+    rules = rules + read_gitignore(directory, base)
+    try:
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+    except OSError:
+        return
+    for entry in entries:
+        name = '{}/{}'.format(base, entry.name) if base else entry.name
+        if entry.is_dir():
+            if (_matches(entry.name, ignore) or is_ignored(name, True, rules) or
+                    os.path.isfile(os.path.join(entry.path, VIRTUALENV_MARKER))):
+                continue
+            for child in _walk(entry.path, ignore, rules, name):
+                yield child
+        elif not is_ignored(name, False, rules):
+            yield name
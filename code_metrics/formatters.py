@@ -1,22 +1,61 @@
 try:
     from cStringIO import StringIO
 except ImportError:
-    from StringIO import StringIO
+    try:
+        from StringIO import StringIO
+    except ImportError:
+        from io import StringIO
 
 import csv
+import itertools
+import json
+import sys
+from collections import OrderedDict
 import tabulate
+from code_metrics import profiling
+
+# formats written row by row, without holding the whole table
+STREAMING_FORMATS = {
+    u'csv': ',',
+    u'tsv': '\t',
+}
+JSON_LINES_FORMAT = u'jsonl'
+
+
+def _write_rows(rows, headers, table_format, stream):
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    rows = itertools.chain([first], rows)
+    if table_format == JSON_LINES_FORMAT:
+        keys = headers or range(len(first))
+        for data in rows:
+            stream.write(json.dumps(OrderedDict(zip(keys, data))))
+            stream.write('\n')
+        return
+    writer = csv.writer(stream, delimiter=STREAMING_FORMATS[table_format])
+    if headers:
+        writer.writerow(headers)
+    for data in rows:
+        writer.writerow(data)
+
+
+def write_table(rows, headers=None, table_format=None, stream=None):
+    stream = stream or sys.stdout
+    with profiling.span('format.table'):
+        if table_format in STREAMING_FORMATS or table_format == JSON_LINES_FORMAT:
+            _write_rows(rows, headers, table_format, stream)
+            return
+        stream.write(as_table(list(rows), headers, table_format))
 
 
 def as_table(rows, headers=None, table_format=None):
     if not rows:
         return ""
-    if table_format == u'csv':
+    if table_format in STREAMING_FORMATS or table_format == JSON_LINES_FORMAT:
         sio = StringIO()
-        csv_writer = csv.writer(sio)
-        if headers:
-            csv_writer.writerow(headers)
-        for data in rows:
-            csv_writer.writerow(data)
+        _write_rows(rows, headers, table_format, sio)
         return sio.getvalue()
 
     if table_format:
@@ -0,0 +1,44 @@
+import operator
+import re
+from collections import OrderedDict, namedtuple
+from code_metrics.diff_metrics import PYTHON_FILES, get_source_metrics
+from code_metrics.git_utils import get_repo, get_changed_files
+
+Violation = namedtuple('Violation', ['file_path', 'metric', 'value', 'limit'])
+
+# FileMetrics field -> how a value compares to the limit when it fails
+LIMITS = OrderedDict([
+    ('complexity', operator.gt),
+    ('maintainability', operator.lt),
+    ('loc', operator.gt),
+])
+
+
+def check_metrics(metrics, limits):
+    # limits maps FileMetrics fields to thresholds, None leaves it unchecked;
+    # a module without functions has no complexity to check
+    for field, fails in LIMITS.items():
+        limit = limits.get(field)
+        value = getattr(metrics, field)
+        if limit is None or value is None:
+            continue
+        if fails(value, limit):
+            yield field, value, limit
+
+
+def iter_violations(repo_path, base, head, limits, ignore=None, cache=None):
+    # only the python files changed in base..head are read, from the object
+    # database and as they are at head; files deleted since have no metrics.
+    # Violations are yielded as found, so the caller can stop at the first.
+    repo = get_repo(repo_path)
+    head_commit = repo.commit(head)
+    changed_files = get_changed_files(
+        repo, base, head, match_only=PYTHON_FILES)
+    for file_path in sorted(changed_files):
+        if ignore and re.match(ignore, file_path):
+            continue
+        metrics = get_source_metrics(head_commit, file_path, cache)
+        if metrics is None:
+            continue
+        for field, value, limit in check_metrics(metrics, limits):
+            yield Violation(file_path, field, value, limit)
@@ -1,10 +1,21 @@
 import re
+import subprocess
+from collections import namedtuple
 from git import Repo, Commit
+from gitdb.util import hex_to_bin
+from code_metrics import profiling
 from code_metrics import utils
 
+# every commit record starts with the record separator and its sha, and its
+# message ends with the unit separator; the numstat lines follow
+LOG_FORMAT = "--format=%x1e%H%n%B%x1f"
+
+CommitStats = namedtuple('CommitStats', ['hexsha', 'message', 'files'])
+
 
 def get_repo(path):
-    return Repo(path)
+    with profiling.span('git.open'):
+        return Repo(path)
 
 
 def get_revision(from_commit, to_commit):
@@ -14,9 +25,11 @@ def get_revision(from_commit, to_commit):
 
 def get_most_recent_tag_names(git_repo=None):
     git_repo = git_repo or Repo()
+    with profiling.span('git.tags'):
+        tags = list(git_repo.tags)
     tag_with_versions = [
         (tag.name, utils.to_version(tag.name))
-        for tag in git_repo.tags
+        for tag in tags
     ]
     # remove unmatched versions
     valid_version_tags = [
@@ -36,11 +49,123 @@ def get_commit_files(git_repo, commit_sha):
     return Commit(git_repo, commit_sha).stats.files
 
 
+def get_file_source(git_commit, file_path):
+    # read the file straight from the object database, no checkout needed
+    with profiling.span('git.read_blob'):
+        try:
+            blob = git_commit.tree.join(file_path)
+        except KeyError:
+            return None
+        data = blob.data_stream.read()
+    profiling.count('bytes_read', len(data))
+    return data.decode('utf-8')
+
+
+def iter_tree_blobs(git_repo, revision):
+    # ls-tree lists a whole tree in one process: "<mode> blob <sha>\t<path>"
+    with profiling.span('git.ls_tree'):
+        listing = git_repo.git.ls_tree("-r", revision)
+    for line in listing.splitlines():
+        info, file_path = line.split("\t", 1)
+        _, object_type, hexsha = info.split()
+        if object_type == "blob":
+            yield hexsha, file_path
+
+
+def get_blob_source(git_repo, hexsha):
+    with profiling.span('git.read_blob'):
+        data = git_repo.odb.stream(hex_to_bin(hexsha)).read()
+    profiling.count('bytes_read', len(data))
+    return data.decode('utf-8')
+
+
+def _parse_numstat(line):
+    insertions, deletions, file_path = line.split("\t", 2)
+    # binary files have no line counts
+    insertions = int(insertions) if insertions != "-" else 0
+    deletions = int(deletions) if deletions != "-" else 0
+    return file_path, {
+        'insertions': insertions,
+        'deletions': deletions,
+        'lines': insertions + deletions,
+    }
+
+
+def parse_log_stats(lines):
+    hexsha, message, files = None, None, None
+    in_message = False
+    for line in lines:
+        line = line.rstrip("\n")
+        if line.startswith("\x1e"):
+            if hexsha:
+                yield CommitStats(hexsha, "\n".join(message), files)
+            hexsha, message, files = line[1:], [], {}
+            in_message = True
+        elif in_message:
+            in_message = not line.endswith("\x1f")
+            message.append(line.rstrip("\x1f"))
+        elif line:
+            file_path, stats = _parse_numstat(line)
+            files[file_path] = stats
+    if hexsha:
+        yield CommitStats(hexsha, "\n".join(message), files)
+
+
+def iter_commits_stats(git_repo, revision):
+    # a single git log process streams message and numstat of every commit
+    # in the range; stats match Commit.stats (first parent diff, no renames)
+    process = git_repo.git.log(
+        revision, LOG_FORMAT, "--numstat", "--no-renames", "--root",
+        "--diff-merges=first-parent", as_process=True)
+    lines = (line.decode('utf-8', 'replace') for line in process.stdout)
+    for commit_stats in profiling.timed_iter('git.log', parse_log_stats(lines)):
+        profiling.count('commits_walked')
+        yield commit_stats
+    process.wait()
+
+
+def iter_commits_messages(git_repo, *revisions):
+    # sha and message of every commit, without diffing them
+    process = git_repo.git.log(LOG_FORMAT, *revisions, as_process=True)
+    lines = (line.decode('utf-8', 'replace') for line in process.stdout)
+    for commit in profiling.timed_iter('git.log', parse_log_stats(lines)):
+        profiling.count('commits_walked')
+        yield commit
+    process.wait()
+
+
+def iter_selected_commits_stats(git_repo, hexshas):
+    # same as iter_commits_stats for the given commits only, in that order
+    hexshas = list(hexshas)
+    if not hexshas:
+        # without revisions git log would list HEAD
+        return
+    process = git_repo.git.log(
+        LOG_FORMAT, "--numstat", "--no-renames", "--root",
+        "--diff-merges=first-parent", "--no-walk=unsorted", "--stdin",
+        istream=subprocess.PIPE, as_process=True)
+    # git reads every revision from stdin before writing anything
+    process.stdin.write("".join(
+        "{}\n".format(hexsha) for hexsha in hexshas).encode('ascii'))
+    process.stdin.close()
+    lines = (line.decode('utf-8', 'replace') for line in process.stdout)
+    for commit_stats in profiling.timed_iter('git.log', parse_log_stats(lines)):
+        profiling.count('commits_walked')
+        yield commit_stats
+    process.wait()
+
+
+def rev_list(git_repo, *revisions):
+    # the commits of a range, walked by git without loading them
+    with profiling.span('git.rev_list'):
+        return git_repo.git.rev_list(*revisions).split()
+
+
 def get_changed_files(git_repo, from_commit, to_commit, match_only=None):
     revision = get_revision(from_commit, to_commit)
     files = set()
-    for commit in git_repo.iter_commits(revision):
-        changed = commit.stats.files.keys()
+    for commit in iter_commits_stats(git_repo, revision):
+        changed = commit.files.keys()
         if match_only:
             changed = [name for name in changed if re.match(match_only, name)]
         files.update(set(changed))
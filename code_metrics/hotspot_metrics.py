@@ -0,0 +1,48 @@
+import heapq
+import re
+from collections import namedtuple
+from code_metrics.bug_metrics import get_bug_score
+from code_metrics.diff_metrics import PYTHON_FILES, get_source_metrics
+from code_metrics.git_utils import get_repo
+
+Hotspot = namedtuple('Hotspot', [
+    'file_path', 'risk', 'changes_score', 'ticket_count', 'tickets',
+    'complexity', 'maintainability',
+])
+
+
+def risk_score(changes_score, complexity):
+    # churn weighted by complexity; a module without functions counts as
+    # the simplest block radon can score
+    return changes_score * (complexity or 1)
+
+
+def get_hotspots(repo_path, from_commit, to_commit, ignore=None,
+                 jira_client=None, cache=None, limit=None):
+    # only the python files changed for bugs are analyzed, once each and
+    # as they are at to_commit; files deleted since have no hotspot
+    score_data = get_bug_score(
+        repo_path, from_commit, to_commit, ignore, jira_client)
+    after_commit = get_repo(repo_path).commit(to_commit)
+
+    def iter_hotspots():
+        for file_path, file_data in score_data.items():
+            if not re.match(PYTHON_FILES, file_path):
+                continue
+            metrics = get_source_metrics(after_commit, file_path, cache)
+            if metrics is None:
+                continue
+            yield Hotspot(
+                file_path,
+                risk_score(file_data['changes_score'], metrics.complexity),
+                file_data['changes_score'],
+                file_data['ticket_count'],
+                sorted(file_data['tickets']),
+                metrics.complexity,
+                metrics.maintainability,
+            )
+
+    key = lambda hotspot: (hotspot.risk, hotspot.changes_score)
+    if limit:
+        return heapq.nlargest(limit, iter_hotspots(), key=key)
+    return sorted(iter_hotspots(), key=key, reverse=True)
@@ -0,0 +1,162 @@
+import ast
+import hashlib
+import os
+
+from code_metrics import profiling
+
+
+def module_name(filename):
+    # dotted name of a file and the directory it is imported from, going
+    # up the packages holding it
+    directory, name = os.path.split(os.path.abspath(filename))
+    parts = [] if name == '__init__.py' else [os.path.splitext(name)[0]]
+    while os.path.isfile(os.path.join(directory, '__init__.py')):
+        directory, package = os.path.split(directory)
+        parts.insert(0, package)
+    return '.'.join(parts), directory
+
+
+def imported_names(source, module, is_package=False):
+    # dotted names a module imports, anywhere in its code; relative imports
+    # are resolved against its package
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            if node.level:
+                package = module.split('.') if is_package else module.split('.')[:-1]
+                package = package[:len(package) - node.level + 1]
+                base = '.'.join(package + ([base] if base else []))
+            if base:
+                names.add(base)
+            names.update(
+                '{}.{}'.format(base, alias.name) if base else alias.name
+                for alias in node.names if alias.name != '*'
+            )
+    return sorted(names)
+
+
+def strongly_connected(nodes, successors):
+    # Tarjan's algorithm without recursion; a component comes out after
+    # every component it reaches
+    index, lowlink = {}, {}
+    stack, on_stack = [], set()
+    components = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors(root)))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors(child))))
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+class ImportGraph(object):
+    # the files the modules import, directly or not, among the ones found
+    # under the directories the linted files are imported from; installed
+    # packages and the standard library are not followed
+
+    def __init__(self, filenames, cache=None):
+        self.roots = sorted(set(module_name(filename)[1] for filename in filenames))
+        self.cache = cache
+        self._sources = {}
+        self._imports = {}
+
+    def _source(self, filename):
+        if filename not in self._sources:
+            try:
+                with open(filename, 'rb') as module:
+                    self._sources[filename] = module.read()
+            except (IOError, OSError):
+                self._sources[filename] = b''
+            profiling.count('bytes_read', len(self._sources[filename]))
+        return self._sources[filename]
+
+    def _imported_names(self, filename):
+        # parsing is cached by content, a warm run only hashes the files
+        source = self._source(filename)
+        module = module_name(filename)[0]
+        digest = hashlib.sha1(b'imports;')
+        digest.update(module.encode('utf-8') + b'\0')
+        digest.update(source)
+        key = digest.hexdigest()
+        names = self.cache.get(key) if self.cache is not None else None
+        if names is None:
+            names = imported_names(
+                source, module, os.path.basename(filename) == '__init__.py')
+            if self.cache is not None:
+                self.cache.set(key, names)
+        return names
+
+    def _resolve(self, name):
+        # the package and module files an import of name loads
+        parts = name.split('.')
+        for root in self.roots:
+            for depth in range(1, len(parts) + 1):
+                path = os.path.join(root, *parts[:depth])
+                for candidate in (os.path.join(path, '__init__.py'), path + '.py'):
+                    if os.path.isfile(candidate):
+                        yield candidate
+
+    def imports(self, filename):
+        if filename not in self._imports:
+            files = set()
+            for name in self._imported_names(filename):
+                files.update(self._resolve(name))
+            files.discard(filename)
+            self._imports[filename] = sorted(files)
+        return self._imports[filename]
+
+    def dependency_keys(self, filenames):
+        # absolute filename -> digest of the files it imports, directly or
+        # not, itself included; modules importing each other share one
+        filenames = [os.path.abspath(filename) for filename in filenames]
+        keys = {}
+        with profiling.span('pylint.imports'):
+            for component in strongly_connected(filenames, self.imports):
+                members = set(component)
+                digest = hashlib.sha1(b'dependencies;')
+                for filename in sorted(component):
+                    digest.update(filename.encode('utf-8') + b'\0')
+                    digest.update(hashlib.sha1(self._source(filename)).digest())
+                for key in sorted(set(
+                        keys[imported] for filename in component
+                        for imported in self.imports(filename)
+                        if imported not in members)):
+                    digest.update(key.encode('ascii'))
+                key = digest.hexdigest()
+                for filename in component:
+                    keys[filename] = key
+        return dict((filename, keys[filename]) for filename in filenames)
@@ -1,24 +1,54 @@
 import os
 import re
+import sys
+from multiprocessing.pool import ThreadPool
 
+import requests
 from jira import JIRA
+from code_metrics import profiling
+from code_metrics import utils
+
+BUG_TYPES = ["Bug", "Bug Sub Task"]
+# keep the JQL short enough for the server and the pages reasonably sized
+KEYS_PER_QUERY = 100
+RESULTS_PER_PAGE = 100
+# concurrent searches share the client's pooled http session
+SEARCH_THREADS = 4
+# issue types of closed tickets rarely change, cached ones live for a week
+DEFAULT_CACHE_TTL = 7 * 24 * 3600
+# the jira session retries with delays growing from 20s, which would hold
+# off the fallback to the cache for minutes when JIRA is down
+MAX_RETRIES = 0
+# seconds to connect and to wait for an answer
+REQUEST_TIMEOUT = (5, 60)
 
 
 class JiraClient(object):
 
-    def __init__(self, **credentials):
+    def __init__(self, cache=None, cache_ttl=DEFAULT_CACHE_TTL, offline=False,
+                 client=None, **credentials):
+        # client is a JIRA connection to reuse, opened on first use otherwise
         self.ticket_pattern = credentials.pop('ticket_pattern')
         self.credentials = credentials
-        self._client = None
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.offline = offline
+        self._client = client
 
     @property
     def client(self):
         if self._client is None:
-            self._client = JIRA(**self.credentials)
+            self._client = JIRA(
+                max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT,
+                **self.credentials)
         return self._client
 
+    @property
+    def connected(self):
+        return self._client is not None
+
     @classmethod
-    def from_environment(cls):
+    def from_environment(cls, **options):
         server = os.environ.get("JIRA_URL")
         user = os.environ.get("JIRA_USER")
         passwd = os.environ.get("JIRA_PASSWORD")
@@ -32,11 +62,15 @@ class JiraClient(object):
         if not project_prefix:
             raise RuntimeError("JIRA project ID required. Set env var JIRA_PROJECT_ID")
 
-        ticket_pattern = r"(^\s*{}-\d+)".format(project_prefix)
+        # several projects can be given separated by commas, e.g. "PROJ,OPS"
+        prefixes = [prefix.strip() for prefix in project_prefix.split(',')]
+        ticket_pattern = r"(^\s*(?:{})-\d+)".format(
+            '|'.join(re.escape(prefix) for prefix in prefixes if prefix))
         return cls(
             server=server,
             basic_auth=(user, passwd),
-            ticket_pattern=ticket_pattern
+            ticket_pattern=ticket_pattern,
+            **options
         )
 
     def get_issue_key(self, message):
@@ -45,14 +79,86 @@ class JiraClient(object):
             return None
         return ticket_match.groups()[0]
 
+    def search_issue_types(self, issues_keys):
+        jql = "key in ({})".format(','.join(issues_keys))
+        issue_types = {}
+        start_at = 0
+        while True:
+            with profiling.span('jira.search'):
+                page = self.client.search_issues(
+                    jql_str=jql,
+                    startAt=start_at,
+                    maxResults=RESULTS_PER_PAGE,
+                    fields='issuetype',
+                    json_result=True,
+                )
+            profiling.count('http_requests')
+            issues = page.get('issues', [])
+            for issue in issues:
+                issue_types[issue['key']] = issue['fields']['issuetype']['name']
+            start_at += len(issues)
+            if not issues or start_at >= page.get('total', 0):
+                return issue_types
+
+    def _cache_key(self, issue_key):
+        return "{}/{}".format(self.credentials.get('server'), issue_key)
+
+    def get_cached_issue_types(self, issues_keys):
+        issue_types = {}
+        if self.cache is None:
+            return issue_types
+        for key in issues_keys:
+            issue_type = self.cache.get(self._cache_key(key), self.cache_ttl)
+            if issue_type is not None:
+                issue_types[key] = issue_type
+        return issue_types
+
+    def search_all_issue_types(self, issues_keys):
+        batches = list(utils.chunks(sorted(issues_keys), KEYS_PER_QUERY))
+        if len(batches) < 2:
+            return self.search_issue_types(batches[0]) if batches else {}
+        # create the client before the threads start sharing it
+        self.client  # pylint: disable=pointless-statement
+        pool = ThreadPool(min(SEARCH_THREADS, len(batches)))
+        try:
+            results = pool.map(self.search_issue_types, batches)
+        finally:
+            pool.terminate()
+        issue_types = {}
+        for batch_types in results:
+            issue_types.update(batch_types)
+        return issue_types
+
+    def get_issue_types(self, issues_list):
+        issues_keys = set(issues_list)
+        issue_types = self.get_cached_issue_types(issues_keys)
+        missing = issues_keys.difference(issue_types)
+        if not missing:
+            return issue_types
+        if self.offline:
+            sys.stderr.write(
+                "{} tickets not found in the cache\n".format(len(missing)))
+            return issue_types
+        try:
+            found = self.search_all_issue_types(missing)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout):
+            if self.cache is None:
+                raise
+            sys.stderr.write(
+                "JIRA is unreachable, using cached issue types only\n")
+            return issue_types
+        if self.cache is not None:
+            for key, issue_type in found.items():
+                self.cache.set(self._cache_key(key), issue_type)
+        issue_types.update(found)
+        return issue_types
+
     def filter_bugs(self, issues_list):
         if not issues_list:
             return []
-        bug_types = ["Bug", "Bug Sub Task"]
-        jql_bug_types = ",".join(["'{}'".format(_type) for _type in bug_types])
-        jql_issues_keys = ','.join(issues_list or [])
-        jql = "issuetype in ({}) AND key in ({})".format(
-            jql_bug_types, jql_issues_keys
-        )
-        bugs = self.client.search_issues(jql_str=jql)
-        return [bug.key for bug in bugs]
+        issue_types = self.get_issue_types(issues_list)
+        return [
+            key for key, issue_type in issue_types.items()
+            if issue_type in BUG_TYPES
+        ]
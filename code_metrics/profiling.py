@@ -0,0 +1,100 @@
+import collections
+import cProfile
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# instrumentation is off unless a command runs with --profile, so the
+# spans and counters below cost a single flag check by default
+_state = {'enabled': False, 'started': None}
+_lock = threading.Lock()
+_spans = collections.defaultdict(lambda: {'count': 0, 'seconds': 0.0})
+_counters = collections.Counter()
+
+
+def enable():
+    _state['enabled'] = True
+    _state['started'] = time.time()
+
+
+def is_enabled():
+    return _state['enabled']
+
+
+def record(name, seconds):
+    with _lock:
+        _spans[name]['count'] += 1
+        _spans[name]['seconds'] += seconds
+
+
+def count(name, value=1):
+    if not _state['enabled']:
+        return
+    with _lock:
+        _counters[name] += value
+
+
+@contextmanager
+def span(name):
+    if not _state['enabled']:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(name, time.time() - start)
+
+
+def timed_iter(name, iterable):
+    # times only the work done to produce each item, not what the
+    # consumer does with it between two items
+    if not _state['enabled']:
+        return iterable
+    return _timed_iter(name, iter(iterable))
+
+
+def _timed_iter(name, iterator):
+    while True:
+        start = time.time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record(name, time.time() - start)
+            return
+        record(name, time.time() - start)
+        yield item
+
+
+def summary(command_name=None):
+    with _lock:
+        spans = dict(
+            (name, {'count': data['count'], 'seconds': round(data['seconds'], 6)})
+            for name, data in sorted(_spans.items())
+        )
+        counters = dict(_counters)
+    return {
+        'command': command_name,
+        'wall_seconds': round(time.time() - (_state['started'] or time.time()), 6),
+        'spans': spans,
+        'counters': counters,
+    }
+
+
+def write_summary(path=None, command_name=None):
+    data = json.dumps(summary(command_name), indent=2, sort_keys=True)
+    if not path or path == '-':
+        sys.stderr.write(data + '\n')
+        return
+    with open(path, 'w') as output:
+        output.write(data + '\n')
+
+
+def run_profiled(func, args, stats_path):
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        profiler.dump_stats(stats_path)
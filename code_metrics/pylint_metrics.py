@@ -1,22 +1,459 @@
-import re
-try:
-    from cStringIO import StringIO
-except ImportError:
-    from StringIO import StringIO
+import collections
+import hashlib
+import os
+import sys
+import time
+from collections import OrderedDict, namedtuple
 
+from pylint import __version__ as pylint_version
 from pylint import lint
-from pylint.reporters.text import TextReporter
+from pylint.reporters import BaseReporter
+from code_metrics import profiling
+from code_metrics.budget import (
+    FileBudget, FileTimeout, budget_map, restart_timer, size_exceeded,
+    time_limit, timeout_reason)
+from code_metrics.discovery import find_python_files
+from code_metrics.import_graph import ImportGraph
 
-SCORE_PATTERN = r"([\d\.]+)\/"
+CATEGORIES = ['fatal', 'error', 'warning', 'refactor', 'convention', 'info']
+DEFAULT_EVALUATION = (
+    "max(0, 0 if fatal else 10.0 - ((float(5 * error + warning + refactor + "
+    "convention) / statement) * 10))"
+)
+# messages emitted once every module of a run is checked, about several
+# modules at once: they are counted per package instead of per module
+CROSS_MODULE_MESSAGES = ('duplicate-code', 'cyclic-import')
 
+# the ignore, ignore-patterns and ignore-paths settings of pylint
+IgnoreSettings = namedtuple('IgnoreSettings', ['names', 'patterns', 'paths'])
 
-def get_global_score(paths, rcfile=None):
+LintResult = namedtuple('LintResult', [
+    'package', 'role', 'stats', 'timings', 'skipped', 'modules', 'cross',
+    'cross_enabled', 'retry',
+])
+
+
+def _stat(stats, name):
+    # pylint < 2.12 keeps its stats in a dict, newer versions in LinterStats
+    if isinstance(stats, dict):
+        return stats.get(name, 0)
+    return getattr(stats, name, 0)
+
+
+class StatsReporter(BaseReporter):
+    # collects message counts and statements instead of printing them
+
+    name = 'stats'
+
+    def __init__(self, output=None, max_seconds=None):
+        BaseReporter.__init__(self, output)
+        self.counts = collections.Counter()
+        self.statements = 0
+        # each module gets max_seconds, the time it took is kept in timings;
+        # pylint visits every module twice, to parse it and to check it
+        self.max_seconds = max_seconds
+        self.timings = collections.Counter()
+        self.current_file = None
+        self._started = None
+        # counts and statements of each module checked, without the
+        # messages spanning modules which are counted apart
+        self.module_counts = collections.defaultdict(collections.Counter)
+        self.module_statements = {}
+        self.cross_counts = collections.Counter()
+        self.cross_enabled = []
+        self._module_names = {}
+
+    def handle_message(self, msg):
+        self.counts[msg.category] += 1
+        if msg.symbol in CROSS_MODULE_MESSAGES or self.current_file is None:
+            self.cross_counts[msg.category] += 1
+        else:
+            self.module_counts[self.current_file][msg.category] += 1
+
+    def _module_done(self):
+        if self.current_file is not None:
+            self.timings[self.current_file] += time.process_time() - self._started
+
+    def on_set_current_module(self, module, filepath):
+        self._module_done()
+        self.current_file = filepath
+        if filepath is not None:
+            self._module_names[filepath] = module
+        self._started = time.process_time()
+        restart_timer(self.max_seconds, filepath)
+
+    def on_close(self, stats, previous_stats):
+        self._module_done()
+        self.current_file = None
+        self.statements = _stat(stats, 'statement')
+        by_module = _stat(stats, 'by_module') or {}
+        for filepath, module in self._module_names.items():
+            self.module_statements[filepath] = by_module.get(
+                module, {}).get('statement', 0)
+        self.cross_enabled = [
+            symbol for symbol in CROSS_MODULE_MESSAGES
+            if self.linter.is_message_enabled(symbol)
+        ]
+
+    def modules_stats(self):
+        # absolute filename -> stats of every module checked to the end
+        return dict(
+            (os.path.abspath(filepath),
+             _counts_stats(self.module_counts[filepath], statements))
+            for filepath, statements in self.module_statements.items()
+        )
+
+    def cross_stats(self):
+        return _counts_stats(self.cross_counts, 0)
+
+    def display_reports(self, layout):
+        pass
+
+    def display_messages(self, layout):
+        pass
+
+    def _display(self, layout):
+        pass
+
+
+def _counts_stats(counts, statements):
+    stats = dict((category, counts[category]) for category in CATEGORIES)
+    stats['statement'] = statements
+    return stats
+
+
+def compute_score(stats, evaluation=DEFAULT_EVALUATION):
+    if not stats.get('statement'):
+        return None
+    scope = dict((category, stats.get(category, 0)) for category in CATEGORIES)
+    scope['statement'] = stats['statement']
+    return float(eval(evaluation, {}, scope)) # pylint: disable=eval-used
+
+
+def lint_stats(paths, rcfile=None, reporter=None, options=()):
     extra = ["--rcfile={}".format(rcfile)] if rcfile else []
-    sio = StringIO()
-    lint.Run(paths + extra, reporter=TextReporter(sio), exit=False)
-    # filter out empty lines
-    lines = [l for l in sio.getvalue().split("\n") if l]
-    # last line should contain global score
-    global_score_msg = lines[-1:][0]
-    score_match = re.findall(SCORE_PATTERN, global_score_msg)[0]
-    return float(score_match)
+    reporter = reporter or StatsReporter()
+    run = lint.Run(list(paths) + extra + list(options), reporter=reporter,
+                   exit=False)
+    stats = dict((category, reporter.counts[category]) for category in CATEGORIES)
+    stats['statement'] = reporter.statements
+    stats['evaluation'] = getattr(
+        run.linter.config, 'evaluation', DEFAULT_EVALUATION)
+    return stats
+
+
+def _lint_package(args):
+    # runs in the worker processes; a module over the time limit stops the
+    # whole run, so the package is linted again without it
+    package, role, filenames, rcfile, max_seconds, options = args
+    filenames = list(filenames)
+    skipped = []
+    while True:
+        reporter = StatsReporter(max_seconds=max_seconds)
+        try:
+            with time_limit(max_seconds):
+                stats = lint_stats(filenames, rcfile, reporter, options)
+            return LintResult(
+                package, role, stats, list(reporter.timings.items()), skipped,
+                reporter.modules_stats(), reporter.cross_stats(),
+                reporter.cross_enabled, None)
+        except FileTimeout:
+            current = reporter.current_file
+            skipped.append((current, timeout_reason(max_seconds)))
+            if current in filenames:
+                filenames.remove(current)
+                if filenames:
+                    continue
+            # nothing left to lint, or stopped before reaching a module,
+            # e.g. loading plugins
+            return LintResult(
+                package, role, None, list(reporter.timings.items()), skipped,
+                {}, None, [], None)
+
+
+def _lint_killed(args, filename, reason):
+    # the result of a package whose worker was killed, to be linted again
+    # without the module it was on when it is known
+    package, role, filenames, rcfile, max_seconds, options = args
+    remaining = [name for name in filenames if name != filename]
+    retry = None
+    if filename in filenames and remaining:
+        retry = (package, role, remaining, rcfile, max_seconds, options)
+    return LintResult(
+        package, role, None, [], [(filename, reason)], {}, None, [], retry)
+
+
+def ignore_settings(rcfile=None):
+    # pylint applies them when it walks a directory, not to the files it
+    # is given, so the files found under a directory are filtered the same
+    # way before being handed to it
+    linter = lint.PyLinter()
+    linter.load_default_plugins()
+    rcfile = rcfile or default_rcfile()
+    try:
+        from pylint.config.config_initialization import _config_initialization
+    except ImportError:
+        # pylint < 2.14
+        linter.read_config_file(rcfile) # pylint: disable=no-member
+        linter.load_config_file() # pylint: disable=no-member
+    else:
+        # messages about the configuration are reported by the lint runs
+        _config_initialization(
+            linter, [], reporter=StatsReporter(), config_file=rcfile)
+    return IgnoreSettings(
+        tuple(linter.config.ignore), tuple(linter.config.ignore_patterns),
+        tuple(getattr(linter.config, 'ignore_paths', None) or ()))
+
+
+def is_lint_ignored(filename, path, settings):
+    # a file under path is ignored when a directory on the way or the file
+    # itself is named in ignore, when its name matches ignore-patterns or
+    # when its path matches ignore-paths
+    names = [os.path.basename(os.path.abspath(path))]
+    names += os.path.relpath(filename, path).split(os.sep)
+    return (
+        any(name in settings.names for name in names)
+        or any(pattern.match(names[-1]) for pattern in settings.patterns)
+        or any(pattern.match(filename) for pattern in settings.paths)
+    )
+
+
+def iter_packages(paths, ignore=None, lint_ignore=None):
+    # a directory that is not a package itself is split into the
+    # packages, modules and plain directories it contains, each with its
+    # python files, less the ones the pylint configuration ignores
+    for path in paths:
+        is_package = os.path.isfile(os.path.join(path, '__init__.py'))
+        if not os.path.isdir(path):
+            yield path, [path]
+            continue
+        filenames = sorted(
+            filename for filename in find_python_files([path], ignore)
+            if lint_ignore is None
+            or not is_lint_ignored(filename, path, lint_ignore))
+        if is_package:
+            if filenames:
+                yield path, filenames
+            continue
+        children = collections.defaultdict(list)
+        for filename in filenames:
+            name = os.path.relpath(filename, path).split(os.sep)[0]
+            children[name].append(filename)
+        for name in sorted(children):
+            yield os.path.join(path, name), children[name]
+
+
+def merge_stats(packages_stats):
+    merged = collections.Counter()
+    evaluation = DEFAULT_EVALUATION
+    for stats in packages_stats:
+        evaluation = stats.get('evaluation', evaluation)
+        merged.update(dict(
+            (key, value) for key, value in stats.items() if key != 'evaluation'
+        ))
+    merged = dict(merged)
+    merged['evaluation'] = evaluation
+    return merged
+
+
+def default_rcfile():
+    # the configuration file pylint reads when no --rcfile is given
+    try:
+        from pylint.config import find_default_config_files
+    except ImportError:
+        from pylint.config import find_pylintrc
+        return find_pylintrc()
+    return next((str(path) for path in find_default_config_files()), None)
+
+
+def config_cache_key(rcfile=None):
+    # everything besides the modules that changes the messages
+    rcfile = rcfile or default_rcfile()
+    digest = hashlib.sha1('pylint={};python={};'.format(
+        pylint_version, sys.version_info[:2]).encode('utf-8'))
+    if rcfile and os.path.isfile(rcfile):
+        with open(rcfile, 'rb') as config:
+            digest.update(config.read())
+    return digest.hexdigest()
+
+
+def module_cache_key(filename, config_key, context_key=''):
+    # the module name pylint reports depends on where the file is, and its
+    # messages on the modules it imports and the ones its package holds
+    with open(filename, 'rb') as module:
+        source = module.read()
+    profiling.count('bytes_read', len(source))
+    digest = hashlib.sha1(source)
+    digest.update(os.path.abspath(filename).encode('utf-8'))
+    digest.update(config_key.encode('utf-8'))
+    digest.update(context_key.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def layout_cache_key(filenames):
+    digest = hashlib.sha1(b'layout;')
+    for filename in sorted(filenames):
+        digest.update(os.path.abspath(filename).encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+
+def package_cache_key(module_keys):
+    digest = hashlib.sha1(b'package;')
+    for key in sorted(module_keys):
+        digest.update(key.encode('ascii'))
+    return digest.hexdigest()
+
+
+def compose_stats(modules_stats, cross_stats, evaluation):
+    stats = merge_stats(list(modules_stats) + [cross_stats])
+    stats['evaluation'] = evaluation
+    return stats
+
+
+def _size_budget(filenames, budget):
+    within = []
+    for filename in filenames:
+        reason = size_exceeded(filename, budget.max_bytes)
+        if reason:
+            budget.skip(filename, reason)
+        else:
+            within.append(filename)
+    return within
+
+
+def get_packages_stats(paths, rcfile=None, jobs=1, ignore=None, budget=None,
+                       cache=None):
+    # files over the size or time limits of the budget are skipped and
+    # recorded in it, along with the time the others took.
+    # With a cache, only the modules changed since they were cached are
+    # linted; the messages spanning modules of a package that changed are
+    # counted again by a run checking only those, which is much cheaper
+    # than linting the whole package. A module is linted again when a file
+    # it imports, directly or not, changed, and when a module is added to
+    # or removed from its package. Arguments that are not files, like
+    # module names, are resolved by pylint and linted without the cache
+    budget = budget or FileBudget()
+    config_key = config_cache_key(rcfile) if cache is not None else None
+    config = cache.get(config_key) if cache is not None else None
+    packages = []
+    lint_ignore = ignore_settings(rcfile)
+    for package, filenames in iter_packages(paths, ignore, lint_ignore):
+        within = _size_budget(filenames, budget)
+        if within:
+            packages.append((package, filenames, within))
+    dependency_keys = {}
+    if cache is not None:
+        linted = [
+            filename for _, _, within in packages for filename in within
+            if os.path.isfile(filename)
+        ]
+        dependency_keys = ImportGraph(linted, cache).dependency_keys(linted)
+
+    # keeps the packages in order, whether linted or cached
+    packages_stats = OrderedDict()
+    # package -> stats of its modules and of the messages spanning them
+    composed = {}
+    module_keys = {}
+    package_keys = {}
+    tasks = []
+    for package, filenames, within in packages:
+        packages_stats[package] = None
+        if cache is None or not all(map(os.path.isfile, within)):
+            tasks.append((package, 'full', within, rcfile, budget.max_seconds, []))
+            continue
+        layout_key = layout_cache_key(filenames)
+        for filename in within:
+            module_keys[os.path.abspath(filename)] = module_cache_key(
+                filename, config_key,
+                layout_key + dependency_keys[os.path.abspath(filename)])
+        keys = [module_keys[os.path.abspath(filename)] for filename in within]
+        package_keys[package] = package_cache_key(keys)
+        modules = dict(
+            (os.path.abspath(filename), cache.get(key))
+            for filename, key in zip(within, keys)
+        )
+        stale = [
+            filename for filename in within
+            if modules[os.path.abspath(filename)] is None
+        ]
+        cross = cache.get(package_keys[package]) if not stale else None
+        if config is None or len(stale) == len(within):
+            tasks.append((package, 'full', within, rcfile, budget.max_seconds, []))
+            continue
+        composed[package] = [
+            dict((name, stats) for name, stats in modules.items() if stats),
+            cross,
+        ]
+        profiling.count('modules_cached', len(within) - len(stale))
+        if stale:
+            tasks.append((package, 'modules', stale, rcfile, budget.max_seconds,
+                          ['--disable=' + ','.join(CROSS_MODULE_MESSAGES)]))
+        if cross is None and config['cross_enabled']:
+            tasks.append((package, 'cross', within, rcfile, budget.max_seconds,
+                          ['--disable=all',
+                           '--enable=' + ','.join(config['cross_enabled'])]))
+
+    # the packages whose worker was killed are linted again in another
+    # round, without the module it was stuck on
+    killed = set()
+    while tasks:
+        retries = []
+        results = profiling.timed_iter('pylint.lint', budget_map(
+            _lint_package, tasks, jobs, budget.max_seconds, _lint_killed))
+        for result in results:
+            for filename, seconds in result.timings:
+                budget.record(filename, seconds)
+            for filename, reason in result.skipped:
+                budget.skip(filename or result.package, reason)
+            if result.role == 'full' and result.stats is not None:
+                packages_stats[result.package] = result.stats
+            elif result.role == 'modules':
+                composed[result.package][0].update(result.modules)
+            elif result.role == 'cross' and result.cross is not None:
+                composed[result.package][1] = result.cross
+            if result.retry is not None:
+                killed.add(result.package)
+                retries.append(result.retry)
+            if cache is None or result.stats is None:
+                continue
+            if result.role != 'cross':
+                # the cross run counts no message of the modules themselves
+                for filename, stats in result.modules.items():
+                    if filename in module_keys:
+                        cache.set(module_keys[filename], stats)
+            if (result.role != 'modules' and not result.skipped
+                    and result.package in package_keys
+                    and result.package not in killed):
+                cache.set(package_keys[result.package], result.cross)
+            if result.role == 'full':
+                config = {'evaluation': result.stats['evaluation'],
+                          'cross_enabled': result.cross_enabled}
+                cache.set(config_key, config)
+        tasks = retries
+
+    for package, (modules, cross) in composed.items():
+        packages_stats[package] = compose_stats(
+            modules.values(), cross or _counts_stats(collections.Counter(), 0),
+            config['evaluation'])
+    packages_stats = OrderedDict(
+        (package, stats) for package, stats in packages_stats.items()
+        if stats is not None
+    )
+    profiling.count('packages_linted', len(packages_stats))
+    profiling.count('statements_linted', sum(
+        stats['statement'] for stats in packages_stats.values()))
+    return packages_stats
+
+
+def get_global_score(paths, rcfile=None, jobs=1, packages_stats=None,
+                     ignore=None, cache=None):
+    if packages_stats is None:
+        packages_stats = get_packages_stats(
+            paths, rcfile, jobs, ignore, cache=cache)
+    return rounded_score(merge_stats(packages_stats.values()))
+
+
+def rounded_score(stats):
+    # same precision pylint prints in its report
+    score = compute_score(stats, stats['evaluation'])
+    return round(score, 2) if score is not None else None
@@ -1,73 +1,223 @@
+import ast
+import hashlib
+import heapq
 import operator
-from collections import OrderedDict
-import radon.complexity as cc_mod
-from radon.cli.harvest import CCHarvester, MIHarvester, RawHarvester
-from radon.cli import Config
-
-
-def get_files_complexity_data(paths, ignore):
-    config = Config(
-        min="A",
-        max="F",
-        exclude=ignore,
-        ignore=ignore,
-        show_complexity=True,
-        average=False,
-        total_average=False,
-        order=getattr(cc_mod, 'SCORE'),
-        no_assert=False,
-        show_closures=False,
-    )
+import time
+from collections import OrderedDict, namedtuple
+from radon import __version__ as radon_version
+from radon.cli.tools import _open
+from radon.metrics import h_visit_ast, mi_compute
+from radon.raw import analyze
+from radon.visitors import ComplexityVisitor
+from code_metrics import profiling
+from code_metrics.aggregates import RunningStats
+from code_metrics.budget import (
+    FileBudget, FileTimeout, budget_map, size_exceeded, time_limit,
+    timeout_reason)
+from code_metrics.discovery import find_python_files
 
-    harvester = CCHarvester(paths, config)
-    data = []
-    for filename, functions in harvester.results:
-        if not functions:
-            continue
-        scores = [
-            function_obj.complexity
-            for function_obj in functions
-        ]
-        average = float(sum(scores)) / len(scores)
-        data.append((filename, average,))
-
-    sorted_scores = sorted(data, key=operator.itemgetter(1), reverse=True)
-    return OrderedDict(sorted_scores)
+# multiline strings are counted as comments, as MIHarvester(multi=True) does
+MI_COUNT_MULTI = True
 
+FileMetrics = namedtuple('FileMetrics', ['complexity', 'maintainability', 'loc'])
 
-def get_files_maintainability_data(paths, ignore):
-    config = Config(
-        min="A",
-        max="C",
-        exclude=ignore,
-        ignore=ignore,
-        multi=True,
-        show=True,
-    )
-    harvester = MIHarvester(paths, config)
-    data = []
-    for filename, mi_data in harvester.results:
-        if not mi_data:
-            continue
-        data.append((filename, mi_data['mi']))
+# everything besides the file content that changes the analysis results
+CACHE_KEY_PREFIX = 'radon={};no_assert=False;multi={};'.format(
+    radon_version, MI_COUNT_MULTI)
 
-    sorted_scores = sorted(data, key=operator.itemgetter(1))
-    return OrderedDict(sorted_scores)
 
+def analyze_source_blocks(source):
+    # parse and tokenize once, then derive every metric from the same
+    # ast and raw counts instead of letting each harvester redo the work;
+    # also returns the (name, line, complexity) of every function and class
+    ast_node = ast.parse(source)
+    raw = analyze(source)
+    visitor = ComplexityVisitor.from_ast(ast_node, no_assert=False)
+
+    scores = [block.complexity for block in visitor.blocks]
+    complexity = float(sum(scores)) / len(scores) if scores else None
 
-def get_files_lines_of_code(paths, ignore):
-    config = Config(
-        exclude=ignore,
-        ignore=ignore,
-        summary=False,
+    comments_lines = raw.comments + (raw.multi if MI_COUNT_MULTI else 0)
+    comments = comments_lines / float(raw.sloc) * 100 if raw.sloc != 0 else 0
+    maintainability = mi_compute(
+        h_visit_ast(ast_node).total.volume,
+        visitor.total_complexity,
+        raw.lloc,
+        comments,
     )
-    harvester = RawHarvester(paths, config)
+    blocks = [
+        (block.fullname, block.lineno, block.complexity)
+        for block in visitor.blocks
+    ]
+    return FileMetrics(complexity, maintainability, raw.loc), blocks
+
+
+def analyze_source(source):
+    return analyze_source_blocks(source)[0]
+
+
+def source_cache_key(source):
+    if not isinstance(source, bytes):
+        source = source.encode('utf-8')
+    digest = hashlib.sha1(source)
+    digest.update(CACHE_KEY_PREFIX.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def analyze_source_cached(source, cache=None):
+    if cache is None:
+        with profiling.span('radon.analyze'):
+            metrics = analyze_source(source)
+        profiling.count('files_parsed')
+        return metrics
+    key = source_cache_key(source)
+    cached = cache.get(key)
+    if cached is not None:
+        return FileMetrics(*cached)
+    with profiling.span('radon.analyze'):
+        metrics = analyze_source(source)
+    profiling.count('files_parsed')
+    cache.set(key, list(metrics))
+    return metrics
+
+
+def _read_source(filename):
+    with _open(filename) as fobj:
+        return fobj.read()
+
+
+def _analyze_file(args):
+    # runs in the worker processes, so it only returns picklable data:
+    # cache key, metrics, size, seconds and the reason it was skipped
+    filename, max_seconds = args
+    start = time.process_time()
+    try:
+        with time_limit(max_seconds):
+            source = _read_source(filename)
+            metrics = analyze_source(source)
+        return (source_cache_key(source), metrics, len(source),
+                time.process_time() - start, None)
+    except FileTimeout:
+        return None, None, 0, time.process_time() - start, timeout_reason(max_seconds)
+    except Exception: # pylint: disable=broad-except
+        # files radon cannot read or parse have no metrics
+        return None, None, 0, time.process_time() - start, None
+
+
+def _analysis_killed(args, filename, reason):
+    # the result of a file whose worker was killed, see _analyze_file
+    return None, None, 0, 0.0, reason
+
 
-    data = []
-    for filename, raw_data in harvester.results:
-        if not raw_data:
+def analyze_file_blocks(filename):
+    try:
+        return analyze_source_blocks(_read_source(filename))
+    except Exception: # pylint: disable=broad-except
+        return None, None
+
+
+def _get_cached_metrics(filename, cache):
+    # None when the file is not in the cache or cannot be read
+    try:
+        source = _read_source(filename)
+        data = cache.get(source_cache_key(source))
+    except Exception: # pylint: disable=broad-except
+        return None
+    profiling.count('bytes_read', len(source))
+    if data is None:
+        return None
+    return FileMetrics(*data)
+
+
+def iter_files_metrics(paths, ignore, cache=None, jobs=1, budget=None):
+    # files over the size or time limits of the budget are skipped and
+    # recorded in it, along with the time the others took. The files
+    # found in the cache are yielded as they are looked up, only the
+    # names of the others are kept until they are analyzed
+    budget = budget or FileBudget()
+    pending = []
+    for filename in find_python_files(paths, ignore):
+        reason = size_exceeded(filename, budget.max_bytes)
+        if reason:
+            budget.skip(filename, reason)
+            continue
+        metrics = None
+        if cache is not None:
+            with profiling.span('radon.cache_lookup'):
+                metrics = _get_cached_metrics(filename, cache)
+        if metrics is None:
+            pending.append(filename)
+        else:
+            yield filename, metrics
+
+    # with several jobs this is the time spent waiting for the workers
+    fresh = profiling.timed_iter('radon.analyze', budget_map(
+        _analyze_file,
+        [(filename, budget.max_seconds) for filename in pending], jobs,
+        budget.max_seconds, _analysis_killed))
+    for filename, result in zip(pending, fresh):
+        key, metrics, size, seconds, skipped = result
+        profiling.count('bytes_read', size)
+        budget.record(filename, seconds)
+        if skipped:
+            budget.skip(filename, skipped)
+        if metrics is None:
             continue
-        data.append((filename, raw_data['loc'],))
+        profiling.count('files_parsed')
+        if cache is not None:
+            cache.set(key, list(metrics))
+        yield filename, metrics
+
+
+def get_files_metrics(paths, ignore, cache=None, jobs=1, budget=None):
+    return OrderedDict(iter_files_metrics(paths, ignore, cache, jobs, budget))
 
-    sorted_scores = sorted(data, key=operator.itemgetter(1), reverse=True)
+
+def sorted_view(files_metrics, field, reverse=False, limit=None):
+    if hasattr(files_metrics, 'items'):
+        files_metrics = files_metrics.items()
+    data = (
+        (filename, getattr(metrics, field))
+        for filename, metrics in files_metrics
+        if getattr(metrics, field) is not None
+    )
+    key = operator.itemgetter(1)
+    if limit:
+        # a bounded heap keeps only the top rows, same order as sorted()
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        return OrderedDict(select(limit, data, key=key))
+    sorted_scores = sorted(data, key=key, reverse=reverse)
     return OrderedDict(sorted_scores)
+
+
+def get_files_complexity_data(paths, ignore, files_metrics=None, limit=None):
+    if files_metrics is None:
+        files_metrics = iter_files_metrics(paths, ignore)
+    return sorted_view(files_metrics, 'complexity', reverse=True, limit=limit)
+
+
+def get_files_maintainability_data(paths, ignore, files_metrics=None,
+                                   limit=None):
+    if files_metrics is None:
+        files_metrics = iter_files_metrics(paths, ignore)
+    return sorted_view(files_metrics, 'maintainability', limit=limit)
+
+
+def get_files_lines_of_code(paths, ignore, files_metrics=None, limit=None):
+    if files_metrics is None:
+        files_metrics = iter_files_metrics(paths, ignore)
+    return sorted_view(files_metrics, 'loc', reverse=True, limit=limit)
+
+
+def aggregate_files_metric(paths, ignore, field, files_metrics=None):
+    # summarizes one metric while the files stream in, without building
+    # the per file table
+    if files_metrics is None:
+        files_metrics = iter_files_metrics(paths, ignore)
+    if hasattr(files_metrics, 'items'):
+        files_metrics = files_metrics.items()
+    return RunningStats().update(
+        getattr(metrics, field)
+        for _, metrics in files_metrics
+        if getattr(metrics, field) is not None
+    )
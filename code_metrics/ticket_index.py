@@ -0,0 +1,123 @@
+import os
+import re
+import sqlite3
+from collections import OrderedDict
+
+from git import GitCommandError
+
+from code_metrics import profiling
+from code_metrics import utils
+from code_metrics.git_utils import iter_commits_messages, rev_list
+
+# anything shaped like a ticket key at the start of the message is indexed,
+# the project prefixes are only applied when the index is queried
+TICKET_KEY = re.compile(r"(^\s*[A-Za-z][A-Za-z0-9_]*-\d+)")
+# commits looked up by a single query
+SHAS_PER_QUERY = 500
+
+
+class TicketIndex(object):
+    # commit sha -> ticket key of every commit reachable from the revisions
+    # indexed so far, stored in the git directory of the repo; the tips of
+    # the indexed history are kept so only new commits are read next time
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS commits ("
+            "sha TEXT PRIMARY KEY, ticket TEXT)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS tips (sha TEXT PRIMARY KEY)"
+        )
+
+    @classmethod
+    def open(cls, git_repo):
+        index_dir = os.path.join(git_repo.git_dir, 'code_metrics')
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        return cls(os.path.join(index_dir, 'tickets.sqlite'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+
+    def _tips(self):
+        return [row[0] for row in self._connection.execute("SELECT sha FROM tips")]
+
+    def update(self, git_repo, revision):
+        # indexes the commits reachable from revision that are not yet;
+        # returns how many were added
+        tip = git_repo.git.rev_parse("{}^{{commit}}".format(revision))
+        tips = self._tips()
+        if tip in tips:
+            return 0
+        try:
+            added = self._add_commits(git_repo, tip, tips)
+        except GitCommandError:
+            # a tip is gone, e.g. after a force push: index everything again
+            self._connection.execute("DELETE FROM commits")
+            tips = []
+            added = self._add_commits(git_repo, tip, tips)
+        # only the tips no other tip descends from are needed to tell
+        # which commits are indexed
+        independent = git_repo.git.merge_base("--independent", tip, *tips).split()
+        self._connection.execute("DELETE FROM tips")
+        self._connection.executemany(
+            "INSERT INTO tips (sha) VALUES (?)", [(sha,) for sha in independent])
+        self._connection.commit()
+        profiling.count('commits_indexed', added)
+        return added
+
+    def _add_commits(self, git_repo, tip, tips):
+        added = 0
+        rows = []
+        for commit in iter_commits_messages(git_repo, tip, "--not", *tips):
+            rows.append((commit.hexsha, _ticket_key(commit.message)))
+            if len(rows) == SHAS_PER_QUERY:
+                added += self._insert(rows)
+                rows = []
+        return added + self._insert(rows)
+
+    def _insert(self, rows):
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO commits (sha, ticket) VALUES (?, ?)", rows)
+        return len(rows)
+
+    def get_tickets(self, hexshas):
+        tickets = {}
+        for batch in utils.chunks(hexshas, SHAS_PER_QUERY):
+            rows = self._connection.execute(
+                "SELECT sha, ticket FROM commits WHERE sha IN ({})".format(
+                    ", ".join("?" * len(batch))), batch)
+            tickets.update(rows)
+        return tickets
+
+    def ticket_commits(self, git_repo, from_commit, to_commit,
+                       ticket_pattern=None):
+        # sha -> ticket key of the commits in the range that have one,
+        # newest first as git log lists them
+        self.update(git_repo, to_commit)
+        hexshas = rev_list(git_repo, "{}..{}".format(from_commit, to_commit))
+        tickets = self.get_tickets(hexshas)
+        ticket_commits = OrderedDict()
+        for hexsha in hexshas:
+            ticket = tickets.get(hexsha)
+            if ticket and ticket_pattern:
+                match = re.match(ticket_pattern, ticket)
+                ticket = match.groups()[0] if match else None
+            if ticket:
+                ticket_commits[hexsha] = ticket
+        return ticket_commits
+
+
+def _ticket_key(message):
+    match = TICKET_KEY.match(message)
+    return match.groups()[0] if match else None
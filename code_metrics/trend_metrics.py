@@ -0,0 +1,62 @@
+import re
+from collections import OrderedDict
+from code_metrics import utils
+from code_metrics.radon_metrics import analyze_source_cached
+from code_metrics.git_utils import (
+    get_repo, get_most_recent_tag_names, iter_tree_blobs, get_blob_source)
+
+PYTHON_FILES = r".*\.py$"
+
+
+def _is_hidden(file_path):
+    # radon does not descend into hidden directories either
+    return any(part.startswith('.') for part in file_path.split('/'))
+
+
+def get_blob_metrics(repo, hexsha, cache=None):
+    try:
+        return analyze_source_cached(get_blob_source(repo, hexsha), cache)
+    except Exception: # pylint: disable=broad-except
+        # files radon cannot decode or parse have no metrics
+        return None
+
+
+def get_tree_metrics(repo, revision, blobs_metrics, ignore=None, cache=None):
+    # blobs_metrics is shared between revisions, so a blob that did not
+    # change since an earlier revision is never analyzed again
+    files_metrics = []
+    for hexsha, file_path in iter_tree_blobs(repo, revision):
+        if not re.match(PYTHON_FILES, file_path) or _is_hidden(file_path):
+            continue
+        if ignore and re.match(ignore, file_path):
+            continue
+        if hexsha not in blobs_metrics:
+            blobs_metrics[hexsha] = get_blob_metrics(repo, hexsha, cache)
+        if blobs_metrics[hexsha] is not None:
+            files_metrics.append(blobs_metrics[hexsha])
+    return files_metrics
+
+
+def _average(values):
+    values = [value for value in values if value is not None]
+    return utils.average(values) if values else None
+
+
+def get_metrics_trend(repo_path, last=None, ignore=None, cache=None):
+    repo = get_repo(repo_path)
+    tags = get_most_recent_tag_names(repo)
+    if last:
+        tags = tags[:last]
+
+    blobs_metrics = {}
+    trend = OrderedDict()
+    # oldest release first
+    for tag in reversed(tags):
+        files_metrics = get_tree_metrics(repo, tag, blobs_metrics, ignore, cache)
+        trend[tag] = (
+            len(files_metrics),
+            _average(metrics.complexity for metrics in files_metrics),
+            _average(metrics.maintainability for metrics in files_metrics),
+            _average(metrics.loc for metrics in files_metrics),
+        )
+    return trend
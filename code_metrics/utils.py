@@ -1,7 +1,15 @@
-from pkg_resources import parse_version
+import functools
+import multiprocessing
+import os
+from contextlib import contextmanager
+
+# a pool kept open by shared_pool() and used by every parallel_map call
+_shared = {}
 
 
 def to_version(name):
+    # pkg_resources is slow to import and only needed to sort tags
+    from pkg_resources import parse_version
     if not name:
         return None
     try:
@@ -12,3 +20,68 @@ def to_version(name):
 
 def average(numbers):
     return sum(numbers) / float(len(numbers))
+
+
+def cpu_count():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def chunk_size(items_count, jobs):
+    # same heuristic as Pool.map: about four chunks per worker
+    chunks, extra = divmod(items_count, jobs * 4)
+    return chunks + 1 if extra else max(chunks, 1)
+
+
+@contextmanager
+def shared_pool(jobs):
+    # lets several commands run in a row reuse the same worker processes
+    pool = multiprocessing.Pool(jobs)
+    _shared.update(pool=pool, jobs=jobs)
+    try:
+        yield pool
+        pool.close()
+    finally:
+        _shared.clear()
+        pool.terminate()
+        pool.join()
+
+
+def _call_in_directory(func, directory, item):
+    # the shared workers were started from another directory
+    os.chdir(directory)
+    return func(item)
+
+
+def parallel_map(func, items, jobs=1):
+    # results come back in the order of items; with more than one job
+    # the items are sent in chunks to a pool of worker processes
+    items = list(items)
+    if 'pool' in _shared and len(items) > 1:
+        func = functools.partial(_call_in_directory, func, os.getcwd())
+        for result in _shared['pool'].imap(
+                func, items, chunk_size(len(items), _shared['jobs'])):
+            yield result
+        return
+    jobs = min(jobs or 1, len(items))
+    if jobs <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap(func, items, chunk_size(len(items), jobs)):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -6,12 +6,13 @@ setup(
     description='Code analysis tool',
     author='Laura Feier',
     author_email='feierlaura10@gmail.com',
-    packages=find_packages(),
+    packages=find_packages(
+        exclude=['benchmarks', 'benchmarks.*', 'tests', 'tests.*']),
     include_package_data=True,
     install_requires=[
-        'mando',
+        'mando>=0.7.1',
         'tabulate',
-        'radon',
+        'radon>=6.0.1',
         'pylint',
         'jira',
         'requests',
@@ -0,0 +1,30 @@
+import pytest
+
+from benchmarks.fake_server import FakeServer
+from code_metrics.cache import Cache
+
+
+@pytest.fixture
+def fake_server():
+    server = FakeServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'cache')
+
+
+@pytest.fixture
+def open_cache(cache_dir):
+    # each call opens the named cache again, as a new run would
+    caches = []
+
+    def _open(name):
+        caches.append(Cache.open(name, cache_dir))
+        return caches[-1]
+
+    yield _open
+    for cache in caches:
+        cache.close()
@@ -0,0 +1,56 @@
+import os
+import time
+
+import pytest
+
+from code_metrics import budget, radon_metrics
+from code_metrics.budget import FileBudget, budget_map
+
+MAX_SECONDS = 0.1
+
+
+def wait_on(item):
+    # blocks without using the cpu, so the cpu timer never fires
+    if item == 'stuck':
+        time.sleep(60)
+    return item.upper()
+
+
+def killed(item, filename, reason):
+    return 'killed', item, reason
+
+
+def test_a_worker_blocked_without_cpu_is_replaced():
+    start = time.time()
+
+    results = list(budget_map(
+        wait_on, ['a', 'stuck', 'b', 'c'], 1, MAX_SECONDS, killed))
+
+    assert results == [
+        'A', ('killed', 'stuck', budget.killed_reason(MAX_SECONDS)), 'B', 'C']
+    assert time.time() - start < budget.wall_limit(MAX_SECONDS) + 5
+
+
+def test_results_come_back_in_order_with_several_workers():
+    items = ['item{}'.format(number) for number in range(20)]
+
+    results = list(budget_map(wait_on, items, 4, MAX_SECONDS, killed))
+
+    assert results == [item.upper() for item in items]
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason="needs named pipes")
+def test_radon_skips_a_file_that_never_finishes_reading(tmp_path,
+                                                        monkeypatch):
+    (tmp_path / 'module.py').write_text('def function():\n    return 1\n')
+    # opening a named pipe blocks until someone writes to it
+    os.mkfifo(str(tmp_path / 'stuck.py'))
+    monkeypatch.chdir(tmp_path)
+    file_budget = FileBudget(max_seconds=MAX_SECONDS)
+
+    files_metrics = dict(
+        radon_metrics.iter_files_metrics(['.'], None, budget=file_budget))
+
+    assert list(files_metrics) == ['module.py']
+    assert file_budget.skipped == [
+        ('stuck.py', budget.killed_reason(MAX_SECONDS))]
@@ -0,0 +1,111 @@
+import pytest
+import requests
+
+from code_metrics import confluence_utils
+from code_metrics.confluence_utils import ConfluenceSpace
+
+
+class FakeTime(object):
+    # records the backoff delays instead of sleeping
+
+    def __init__(self):
+        self.delays = []
+
+    def sleep(self, seconds):
+        self.delays.append(seconds)
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(confluence_utils, 'time', fake)
+    return fake
+
+
+@pytest.fixture
+def space(fake_server):
+    return ConfluenceSpace(fake_server.confluence_url, 'user', 'secret', 'SPACE')
+
+
+def page(fake_server, title):
+    return next(
+        data for data in fake_server.pages.values() if data['title'] == title)
+
+
+def test_publish_creates_pages(fake_server, space, open_cache):
+    results = space.publish_pages(
+        [('Report A', '<p>a</p>'), ('Report B', '<p>b</p>')],
+        cache=open_cache('confluence'))
+
+    assert [(title, status) for title, _, status in results] == [
+        ('Report A', 'created'), ('Report B', 'created')]
+    assert page(fake_server, 'Report A')['body'] == '<p>a</p>'
+    assert page(fake_server, 'Report B')['version'] == 1
+
+
+def test_publish_skips_unchanged_pages(fake_server, open_cache):
+    ConfluenceSpace(
+        fake_server.confluence_url, 'user', 'secret', 'SPACE').publish_pages(
+            [('Report', '<p>a</p>')], cache=open_cache('confluence'))
+
+    results = ConfluenceSpace(
+        fake_server.confluence_url, 'user', 'secret', 'SPACE').publish_pages(
+            [('Report', '<p>a</p>')], cache=open_cache('confluence'))
+
+    assert results[0][2] == 'unchanged'
+    assert page(fake_server, 'Report')['version'] == 1
+
+
+def test_publish_updates_changed_pages(fake_server, space, open_cache):
+    cache = open_cache('confluence')
+    space.publish_pages([('Report', '<p>a</p>')], cache=cache)
+
+    results = space.publish_pages([('Report', '<p>b</p>')], cache=cache)
+
+    assert results[0][2] == 'updated'
+    assert page(fake_server, 'Report')['version'] == 2
+    assert page(fake_server, 'Report')['body'] == '<p>b</p>'
+
+
+def test_update_retries_on_top_of_a_concurrent_edit(fake_server, space,
+                                                    fake_time):
+    page_id = space.create_page('Report', content='<p>a</p>')
+    # someone else saves the page after it was looked up
+    page(fake_server, 'Report')['version'] += 1
+
+    space.set_page_content(page_id, '<p>b</p>')
+
+    assert page(fake_server, 'Report')['version'] == 3
+    assert page(fake_server, 'Report')['body'] == '<p>b</p>'
+    assert fake_time.delays == [confluence_utils.BACKOFF_SECONDS]
+
+
+def test_server_errors_are_retried_with_backoff(fake_server, space,
+                                                fake_time):
+    fake_server.fail_next = 2
+
+    results = space.publish_pages([('Report', '<p>a</p>')])
+
+    assert results[0][2] == 'created'
+    assert page(fake_server, 'Report')['body'] == '<p>a</p>'
+    assert fake_time.delays == [
+        confluence_utils.BACKOFF_SECONDS, 2 * confluence_utils.BACKOFF_SECONDS]
+
+
+def test_server_errors_stop_after_the_last_retry(fake_server, space,
+                                                 fake_time):
+    fake_server.fail_next = confluence_utils.RETRIES
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        space.get_page_id('Report')
+    assert fake_server.requests == confluence_utils.RETRIES
+    # no backoff once the last attempt failed
+    assert len(fake_time.delays) == confluence_utils.RETRIES - 1
+
+
+def test_publish_reports_the_server_error(fake_server, space, fake_time):
+    fake_server.fail_next = confluence_utils.RETRIES
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        space.publish_pages([('Report', '<p>a</p>')])
+    assert not fake_server.pages
@@ -0,0 +1,107 @@
+import sqlite3
+import time
+
+import pytest
+import requests
+
+from code_metrics.jira_utils import JiraClient
+
+TICKET_PATTERN = r"(^\s*PROJ-\d+)"
+# PROJ-3 and PROJ-6 are bugs for the fake server
+KEYS = ['PROJ-1', 'PROJ-2', 'PROJ-3', 'PROJ-6']
+
+
+def jira_client(server_url, cache=None, **options):
+    return JiraClient(
+        cache=cache, server=server_url, basic_auth=('user', 'secret'),
+        ticket_pattern=TICKET_PATTERN, **options)
+
+
+def age_entries(cache, seconds):
+    connection = sqlite3.connect(cache.path)
+    with connection:
+        connection.execute(
+            "UPDATE entries SET created = created - ?", (seconds,))
+    connection.close()
+
+
+def test_issue_types(fake_server):
+    issue_types = jira_client(fake_server.url).get_issue_types(KEYS)
+
+    assert issue_types == {
+        'PROJ-1': 'Story', 'PROJ-2': 'Story', 'PROJ-3': 'Bug', 'PROJ-6': 'Bug',
+    }
+    assert sorted(jira_client(fake_server.url).filter_bugs(KEYS)) == [
+        'PROJ-3', 'PROJ-6']
+
+
+def test_cached_issue_types_are_not_fetched_again(fake_server, open_cache):
+    jira_client(fake_server.url, open_cache('jira')).get_issue_types(KEYS)
+    requests_made = fake_server.requests
+
+    cache = open_cache('jira')
+    issue_types = jira_client(fake_server.url, cache).get_issue_types(KEYS)
+
+    assert fake_server.requests == requests_made
+    assert len(issue_types) == len(KEYS)
+    assert cache.hits == len(KEYS)
+
+
+def test_expired_issue_types_are_fetched_again(fake_server, open_cache):
+    cache = open_cache('jira')
+    jira_client(fake_server.url, cache).get_issue_types(KEYS)
+    age_entries(cache, 2 * 3600)
+    requests_made = fake_server.requests
+
+    issue_types = jira_client(
+        fake_server.url, cache, cache_ttl=3600).get_issue_types(KEYS)
+
+    assert fake_server.requests > requests_made
+    assert cache.misses == 2 * len(KEYS)
+    assert issue_types['PROJ-3'] == 'Bug'
+
+
+def test_fresh_issue_types_are_kept_within_ttl(fake_server, open_cache):
+    cache = open_cache('jira')
+    jira_client(fake_server.url, cache).get_issue_types(KEYS)
+    age_entries(cache, 1800)
+    requests_made = fake_server.requests
+
+    jira_client(fake_server.url, cache, cache_ttl=3600).get_issue_types(KEYS)
+
+    assert fake_server.requests == requests_made
+
+
+def test_offline_uses_the_cache_only(fake_server, open_cache, capsys):
+    cache = open_cache('jira')
+    jira_client(fake_server.url, cache).get_issue_types(KEYS[:2])
+    requests_made = fake_server.requests
+
+    issue_types = jira_client(
+        fake_server.url, cache, offline=True).get_issue_types(KEYS)
+
+    assert fake_server.requests == requests_made
+    assert issue_types == {'PROJ-1': 'Story', 'PROJ-2': 'Story'}
+    assert "2 tickets not found in the cache" in capsys.readouterr().err
+
+
+def test_unreachable_jira_falls_back_to_the_cache(fake_server, open_cache,
+                                                  capsys):
+    cache = open_cache('jira')
+    jira_client(fake_server.url, cache).get_issue_types(KEYS[:2])
+    fake_server.stop()
+
+    start = time.time()
+    issue_types = jira_client(fake_server.url, cache).get_issue_types(KEYS)
+
+    assert issue_types == {'PROJ-1': 'Story', 'PROJ-2': 'Story'}
+    assert "JIRA is unreachable" in capsys.readouterr().err
+    # no retries with growing delays before falling back
+    assert time.time() - start < 5
+
+
+def test_unreachable_jira_without_cache_fails(fake_server):
+    fake_server.stop()
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        jira_client(fake_server.url).get_issue_types(KEYS)
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from code_metrics import pylint_metrics
+
+MODULE = '''"""A module."""
+
+
+def add(first, second):
+    """Adds."""
+    return first + second
+
+
+def unused(value):
+    """Ignores its argument."""
+    other = 1
+    return 2
+'''
+
+
+def packages_scores(paths, cache=None, **options):
+    packages_stats = pylint_metrics.get_packages_stats(
+        paths, cache=cache, **options)
+    return dict(
+        (package, pylint_metrics.compute_score(stats, stats['evaluation']))
+        for package, stats in packages_stats.items()
+    )
+
+
+def test_module_names_are_linted_with_the_cache(tmp_path, monkeypatch,
+                                                open_cache):
+    (tmp_path / 'sample.py').write_text(MODULE)
+    monkeypatch.chdir(tmp_path)
+
+    uncached = packages_scores(['sample'])
+    cached = packages_scores(['sample'], open_cache('pylint'))
+
+    assert list(cached) == ['sample']
+    assert cached == uncached
+
+
+@pytest.mark.parametrize('setting', [
+    'ignore=migrations',
+    'ignore-patterns=^0001_',
+    'ignore-paths=.*/migrations/.*',
+])
+@pytest.mark.parametrize('use_cache', [False, True])
+def test_files_ignored_by_the_rcfile_are_not_linted(tmp_path, monkeypatch,
+                                                    open_cache, setting,
+                                                    use_cache):
+    package = tmp_path / 'src' / 'package'
+    (package / 'migrations').mkdir(parents=True)
+    (package / '__init__.py').write_text('"""A package."""\n')
+    (package / 'good.py').write_text('"""A module."""\nVALUE = 1\n')
+    (package / 'migrations' / '__init__.py').write_text('')
+    (package / 'migrations' / '0001_initial.py').write_text(MODULE)
+    (tmp_path / 'pylintrc').write_text('[MAIN]\n{}\n'.format(setting))
+    monkeypatch.chdir(tmp_path)
+    cache = open_cache('pylint') if use_cache else None
+
+    scores = packages_scores(['src'], cache, rcfile='pylintrc')
+
+    assert scores == {os.path.join('src', 'package'): 10.0}